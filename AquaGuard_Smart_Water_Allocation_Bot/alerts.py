@@ -1,48 +1,210 @@
+import json
+import heapq
+import queue
+import itertools
+import threading
+import urllib.request
+from collections import defaultdict
 import streamlit as st
-from config import DROUGHT_THRESHOLD, RESERVOIR_SAFE_LEVEL, RESERVOIR_LEVELS
+from config import DROUGHT_THRESHOLD, RESERVOIR_SAFE_LEVEL, RESERVOIR_LEVELS, ALERT_WEBHOOK_URL
+from models import subscribe_reservoir_levels
+
+SEVERITY_RANK = {'🔴 CRITICAL': 0, '🟡 WARNING': 1, '🔵 INFO': 2}
+ANY = "*"
+
+
+def reservoir_rule(payload):
+    region, level = payload['region'], payload['level']
+    if level < DROUGHT_THRESHOLD:
+        return {
+            'severity': '🔴 CRITICAL',
+            'message': f'Region {region} in DROUGHT! Level: {level}%',
+            'action': 'Impose strict conservation measures'
+        }
+    if level < RESERVOIR_SAFE_LEVEL:
+        return {
+            'severity': '🟡 WARNING',
+            'message': f'Region {region} below safe level: {level}%',
+            'action': 'Consider voluntary conservation'
+        }
+    return None
+
+
+def large_reduction_rule(log):
+    if log.get('requested') and log['requested'] > log['allocated'] * 1.5:
+        return {
+            'severity': '🔵 INFO',
+            'message': f'Large reduction in Region {log["region"]}',
+            'action': 'Check infrastructure capacity'
+        }
+    return None
+
+
+class AlertRule:
+    """evaluate(payload) returns an alert dict, or None when the condition
+    it watches is clear. Alerts are deduplicated by (rule name, region)."""
+
+    def __init__(self, name, event, evaluate, region=ANY, sector=ANY):
+        self.name = name
+        self.event = event
+        self.evaluate = evaluate
+        self.region = region
+        self.sector = sector
+
+
+class AlertEngine:
+    """Evaluates alert rules as WaterAllocation events fire.
+
+    Rules are indexed by (event, region, sector), so an event only touches
+    the rules registered for its region/sector plus the wildcard ones.
+    Active alerts live in a dict keyed by (rule, region) with a heap of
+    (severity, newest first) on top for the sidebar."""
+
+    def __init__(self, sink=None):
+        self.rules = defaultdict(list)
+        self.active = {}
+        self.heap = []
+        self.seq = itertools.count()
+        self.sink = sink
+        # reservoir levels arrive from other sessions' threads as well
+        self.lock = threading.RLock()
+
+    def add_rule(self, rule):
+        self.rules[(rule.event, rule.region, rule.sector)].append(rule)
+
+    def rules_for(self, event, region, sector=ANY):
+        keys = {(event, region, sector), (event, region, ANY), (event, ANY, sector), (event, ANY, ANY)}
+        return [rule for key in keys for rule in self.rules.get(key, ())]
+
+    def handle(self, event, payload, notify=True):
+        with self.lock:
+            self._handle(event, payload, notify)
+
+    def on_reservoir_level(self, region, level):
+        # the ledger that made the change already notified the sink
+        self.handle("reservoir_level", {"region": region, "level": level}, notify=False)
+
+    def _handle(self, event, payload, notify):
+        for rule in self.rules_for(event, payload.get('region'), payload.get('sector', ANY)):
+            key = (rule.name, payload.get('region'))
+            alert = rule.evaluate(payload)
+            if alert is None:
+                self.active.pop(key, None)
+            else:
+                self.raise_alert(key, alert, notify)
+        if len(self.heap) > 2 * len(self.active) + 16:
+            self.heap = [entry for entry in self.heap if self._current(entry)]
+            heapq.heapify(self.heap)
+
+    def raise_alert(self, key, alert, notify=True):
+        current = self.active.get(key)
+        if current is not None and current[1] == alert:
+            return
+        seq = next(self.seq)
+        self.active[key] = (seq, alert)
+        heapq.heappush(self.heap, (SEVERITY_RANK.get(alert['severity'], len(SEVERITY_RANK)), -seq, key))
+        if notify and self.sink is not None:
+            self.sink.emit(alert)
+
+    def _current(self, entry):
+        active = self.active.get(entry[2])
+        return active is not None and active[0] == -entry[1]
+
+    def top(self, n):
+        with self.lock:
+            return self._top(n)
+
+    def _top(self, n):
+        while self.heap and not self._current(self.heap[0]):
+            heapq.heappop(self.heap)
+        return [self.active[entry[2]][1] for entry in heapq.nsmallest(n, filter(self._current, self.heap))]
+
+    def __len__(self):
+        return len(self.active)
+
+
+class QueueSink:
+    """Hands every new alert to a queue.Queue for another consumer."""
+
+    def __init__(self, target=None):
+        self.queue = target if target is not None else queue.Queue()
+
+    def emit(self, alert):
+        self.queue.put_nowait(alert)
+
+
+class WebhookSink(QueueSink):
+    """POSTs every new alert as JSON to a (local) webhook from a background thread."""
+
+    def __init__(self, url, timeout=5):
+        super().__init__()
+        self.url = url
+        self.timeout = timeout
+        threading.Thread(target=self._deliver, name="alert-webhook", daemon=True).start()
+
+    def _deliver(self):
+        while True:
+            alert = self.queue.get()
+            request = urllib.request.Request(
+                self.url, data=json.dumps(alert).encode(), headers={"Content-Type": "application/json"}
+            )
+            try:
+                urllib.request.urlopen(request, timeout=self.timeout).close()
+            except Exception as e:
+                print(f"Alert webhook error: {e}")
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_alert_sink():
+    """Process-wide webhook sink (one delivery thread), or None without a URL."""
+    global _sink
+    with _sink_lock:
+        if _sink is None and ALERT_WEBHOOK_URL:
+            _sink = WebhookSink(ALERT_WEBHOOK_URL)
+        return _sink
+
+
+def get_alert_engine(water_alloc):
+    """The engine attached to water_alloc, created, subscribed and seeded with
+    the current reservoir levels on first use. Seeding only rebuilds the
+    active alerts; they were already delivered to the sink when first raised.
+    Reservoir levels are process-wide, so the engine also follows level
+    changes made through any other ledger; only the ledger that made a
+    change notifies the sink."""
+    engine = getattr(water_alloc, "alert_engine", None)
+    if engine is None:
+        engine = water_alloc.alert_engine = AlertEngine(get_alert_sink())
+        engine.add_rule(AlertRule("reservoir", "reservoir_level", reservoir_rule))
+        engine.add_rule(AlertRule("large_reduction", "allocation", large_reduction_rule))
+        water_alloc.subscribe(engine.handle)
+        subscribe_reservoir_levels(engine.on_reservoir_level)
+        for region, level in RESERVOIR_LEVELS.items():
+            engine.handle("reservoir_level", {"region": region, "level": level}, notify=False)
+    return engine
+
 
 class AlertSystem:
     def __init__(self, water_alloc):
         self.water_alloc = water_alloc
-        
+        self.engine = get_alert_engine(water_alloc)
+
     def check_alerts(self):
-        alerts = []
-        
-        for region, level in RESERVOIR_LEVELS.items():
-            if level < DROUGHT_THRESHOLD:
-                alerts.append({
-                    'severity': '🔴 CRITICAL',
-                    'message': f'Region {region} in DROUGHT! Level: {level}%',
-                    'action': 'Impose strict conservation measures'
-                })
-            elif level < RESERVOIR_SAFE_LEVEL:
-                alerts.append({
-                    'severity': '🟡 WARNING',
-                    'message': f'Region {region} below safe level: {level}%',
-                    'action': 'Consider voluntary conservation'
-                })
-        
-        for log in self.water_alloc.logs[-5:]:
-            if 'requested' in log and log.get('requested', 0) > log['allocated'] * 1.5:
-                alerts.append({
-                    'severity': '🔵 INFO',
-                    'message': f'Large reduction in Region {log["region"]}',
-                    'action': 'Check infrastructure capacity'
-                })
-        
-        return alerts
-    
+        return self.engine.top(len(self.engine))
+
     def render_sidebar(self):
         st.sidebar.header("🚨 Active Alerts")
-        alerts = self.check_alerts()
-        
+        alerts = self.engine.top(3)
+
         if not alerts:
             st.sidebar.success("✅ No active alerts")
         else:
-            for alert in alerts[:3]:
+            for alert in alerts:
                 st.sidebar.markdown(f"{alert['severity']} **{alert['message']}**")
                 st.sidebar.caption(f"Action: {alert['action']}")
                 st.sidebar.divider()
-            
-            if len(alerts) > 3:
-                st.sidebar.caption(f"... and {len(alerts) - 3} more alerts")
\ No newline at end of file
+
+            if len(self.engine) > 3:
+                st.sidebar.caption(f"... and {len(self.engine) - 3} more alerts")
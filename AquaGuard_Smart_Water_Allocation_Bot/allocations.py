@@ -2,6 +2,7 @@ from config import (
     PER_CAPITA_DOMESTIC, AGRICULTURAL_BENCHMARK, INDUSTRIAL_BENCHMARK,
     RESERVOIR_SAFE_LEVEL, RESERVOIR_LEVELS, TOTAL_SUPPLIES
 )
+from tracing import span, traced
 
 class AllocationProcessor:
     def __init__(self, water_alloc):
@@ -19,14 +20,22 @@ class AllocationProcessor:
         except Exception as e:
             return None, None, None, None, None, f"Invalid request format. Please use: Region: id, Population: pop, Sector: sec, Volume: vol, Cycle: cyc"
 
+    @traced("allocation.process_request")
     def process_request(self, request_text, drought_mode):
-        region, population, sector, volume, cycle, error = self.parse_request(request_text)
+        with span("allocation.parse"):
+            region, population, sector, volume, cycle, error = self.parse_request(request_text)
         if error:
             return error, "error"
             
         if sector not in ['domestic', 'agricultural', 'industrial']:
             return f"Invalid sector '{sector}'. Must be domestic, agricultural, or industrial.", "error"
             
+        # check-then-allocate under the ledger lock: every session showing the
+        # ledger shares this WaterAllocation
+        with self.water_alloc.lock:
+            return self._allocate(region, population, sector, volume, cycle, drought_mode)
+
+    def _allocate(self, region, population, sector, volume, cycle, drought_mode):
         if sector in self.water_alloc.allocations[region][cycle]:
             return f"Duplicate request for region {region}, cycle {cycle}, sector {sector}.", "error"
 
@@ -60,7 +69,8 @@ class AllocationProcessor:
         
         self.water_alloc.add_allocation(region, cycle, sector, volume, 
                                        "Approved" if volume == benchmark else "Reduced", 
-                                       f"Allocated {volume:,.0f}L")
+                                       f"Allocated {volume:,.0f}L",
+                                       requested=original_volume, level=level)
 
         
         if volume == benchmark:
@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
+from tracing import span, traced
 
 class Analytics:
     def __init__(self, water_alloc):
@@ -9,13 +9,23 @@ class Analytics:
     def get_dataframe(self):
         if not self.water_alloc.logs:
             return pd.DataFrame()
-        return pd.DataFrame(self.water_alloc.logs)
+        # Built once per ledger version; callers must not modify it
+        version = len(self.water_alloc.logs)
+        cached = getattr(self.water_alloc, "frame_cache", None)
+        if cached is None or cached[0] != version:
+            with span("analytics.dataframe"):
+                cached = self.water_alloc.frame_cache = (version, pd.DataFrame(self.water_alloc.logs))
+        return cached[1]
     
+    @traced("analytics.forecast_demand")
     def forecast_demand(self, cycles_ahead=2):
         df = self.get_dataframe()
         if len(df) < 3:
             return {}
             
+        # scikit-learn is slow to import and only needed here
+        from sklearn.linear_model import LinearRegression
+
         predictions = {}
         for region in df['region'].unique():
             region_data = df[df['region'] == region].groupby('cycle')['allocated'].sum()
@@ -28,6 +38,7 @@ class Analytics:
                 predictions[region] = max(0, model.predict([[next_cycle]])[0])
         return predictions
     
+    @traced("analytics.detect_anomalies")
     def detect_anomalies(self, threshold=2.5):
         df = self.get_dataframe()
         if len(df) < 5:
@@ -49,6 +60,7 @@ class Analytics:
         
         return pd.concat(anomalies) if anomalies else pd.DataFrame()
     
+    @traced("analytics.get_statistics")
     def get_statistics(self):
         df = self.get_dataframe()
         if df.empty:
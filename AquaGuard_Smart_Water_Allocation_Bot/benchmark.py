@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import platform
+import statistics
+import numpy as np
+import config
+from config import BASE_DIR
+
+DEFAULT_BASELINE = os.path.join(BASE_DIR, "benchmark_baseline.json")
+SECTORS = ["domestic", "agricultural", "industrial"]
+TOPICS = ["allocation", "reservoir", "drought", "permit", "groundwater", "abstraction", "irrigation",
+          "industrial", "domestic", "priority", "conservation", "licence", "metering", "compliance"]
+
+
+class SyntheticLoad:
+    """Reproducible synthetic regions, allocation requests and regulation text."""
+
+    def __init__(self, regions=50, sectors=SECTORS, cycles=12, requests=5000, documents=200, seed=0):
+        self.regions = regions
+        self.sectors = list(sectors)
+        self.cycles = cycles
+        self.requests = requests
+        self.documents = documents
+        self.seed = seed
+
+    def configure_supply(self):
+        """Give every synthetic region a supply and reservoir level (config dicts are shared by reference)."""
+        rng = random.Random(self.seed)
+        for region in range(1, self.regions + 1):
+            config.TOTAL_SUPPLIES.setdefault(region, rng.choice([250000, 500000, 1000000]))
+            config.RESERVOIR_LEVELS.setdefault(region, rng.randint(30, 100))
+
+    def request_texts(self):
+        rng = random.Random(self.seed)
+        combos = [(r, c, s) for r in range(1, self.regions + 1)
+                  for c in range(1, self.cycles + 1) for s in self.sectors]
+        rng.shuffle(combos)
+        texts = []
+        for i in range(self.requests):
+            # once every combination is used the rest exercise the duplicate path
+            region, cycle, sector = combos[i % len(combos)]
+            population = rng.randint(1, 500)
+            volume = rng.choice([1000, 5000, 20000, 100000, 750000])
+            texts.append(f"Region: {region}, Population: {population}, Sector: {sector}, Volume: {volume}, Cycle: {cycle}")
+        return texts
+
+    def allocations(self):
+        rng = random.Random(self.seed)
+        for i in range(self.requests):
+            yield (rng.randint(1, self.regions), i % self.cycles + 1, rng.choice(self.sectors),
+                   float(rng.randint(100, 100000)), rng.choice(["Approved", "Reduced"]), "benchmark")
+
+    def corpus(self, paragraphs=12):
+        """PDF-like pages of regulation text with section numbers and permit ids."""
+        from langchain_core.documents import Document
+        rng = random.Random(self.seed)
+        docs = []
+        for d in range(self.documents):
+            lines = []
+            for p in range(paragraphs):
+                words = " ".join(rng.choice(TOPICS) for _ in range(rng.randint(25, 60)))
+                lines.append(f"Section {d % 20 + 1}.{p + 1} Permit WP-{2020 + d % 5}-{d * paragraphs + p:04d}. {words}.")
+            docs.append(Document(page_content="\n".join(lines), metadata={"source": f"synthetic_{d}.pdf", "page": 0}))
+        return docs
+
+    def questions(self, n=50):
+        rng = random.Random(self.seed + 1)
+        questions = [f"What does the regulation say about {rng.choice(TOPICS)} and {rng.choice(TOPICS)}?"
+                     for _ in range(n - n // 5)]
+        questions += [f"Section {rng.randint(1, 20)}.{rng.randint(1, 12)}" for _ in range(n // 5)]
+        return questions
+
+
+def fake_embeddings(dim=384):
+    """Deterministic hashed bag-of-words embeddings; stands in for the sentence-transformers model."""
+    from langchain_core.embeddings import Embeddings
+
+    class HashEmbeddings(Embeddings):
+        model_name = "benchmark-hash"
+
+        def embed_query(self, text):
+            vector = np.zeros(dim, dtype="float32")
+            for token in text.lower().split():
+                digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+                vector[int.from_bytes(digest[:4], "little") % dim] += 1.0 if digest[4] & 1 else -1.0
+            norm = np.linalg.norm(vector)
+            return (vector / norm if norm else vector).tolist()
+
+        def embed_documents(self, texts):
+            return [self.embed_query(text) for text in texts]
+
+    return HashEmbeddings()
+
+
+def timed(fn, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def record(results, name, times, items=1):
+    median = statistics.median(times)
+    results[name] = {
+        "median_s": median,
+        "min_s": min(times),
+        "mean_s": statistics.fmean(times),
+        "items": items,
+        "per_item_us": median / items * 1e6 if items else None,
+    }
+    print(f"{name:<34}{median * 1000:>12.2f} ms{results[name]['per_item_us']:>14.2f} us/item  ({items} items)")
+
+
+def run_sharded(texts, shards, repeat):
+    """Time process_batch on a fresh ShardRouter per run (worker start-up excluded)."""
+    from sharding import ShardRouter
+    times = []
+    for _ in range(repeat):
+        with ShardRouter(shards) as router:
+            start = time.perf_counter()
+            router.process_batch([(text, False) for text in texts])
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def run_suite(load, repeat=3, skip_kb=False, shards=0):
+    from models import WaterAllocation
+    from allocations import AllocationProcessor
+    from analytics import Analytics
+    from simulation import ScenarioSimulator
+
+    load.configure_supply()
+    results = {}
+    texts = load.request_texts()
+
+    def process_all():
+        water_alloc = WaterAllocation()
+        processor = AllocationProcessor(water_alloc)
+        for text in texts:
+            processor.process_request(text, False)
+        return water_alloc
+    times, water_alloc = timed(process_all, repeat)
+    record(results, "allocation.process_request", times, len(texts))
+
+    if shards:
+        record(results, f"sharding.process_batch[{shards}]", run_sharded(texts, shards, repeat), len(texts))
+
+    allocations = list(load.allocations())
+
+    def add_all():
+        ledger = WaterAllocation()
+        for args in allocations:
+            ledger.add_allocation(*args)
+        return ledger
+    times, ledger = timed(add_all, repeat)
+    record(results, "models.add_allocation", times, len(allocations))
+
+    times, _ = timed(ledger.audit.verify_chain, repeat)
+    record(results, "models.verify_chain", times, len(ledger.audit.chain))
+
+    analytics = Analytics(ledger)
+
+    def cold(fn):
+        # drop the per-version DataFrame cache so each run pays for the frame
+        def run():
+            ledger.__dict__.pop("frame_cache", None)
+            return fn()
+        return run
+    for name in ("forecast_demand", "detect_anomalies", "get_statistics"):
+        times, _ = timed(cold(getattr(analytics, name)), repeat)
+        record(results, f"analytics.{name}", times, len(ledger.logs))
+
+    simulator = ScenarioSimulator(water_alloc)
+    times, _ = timed(lambda: simulator.run_simulation(True, 20, 2, 10, 15, 0, load.cycles), repeat)
+    record(results, "simulation.run_simulation", times, load.cycles)
+
+    if not skip_kb:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        from vector_index import build_vector_store
+        from retrieval import BM25Index, HybridRetriever, chunk_id
+
+        embeddings = fake_embeddings()
+        docs = load.corpus()
+        chunks = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=50).split_documents(docs)
+        for chunk in chunks:
+            chunk_id(chunk)
+
+        def build():
+            store = build_vector_store(chunks, embeddings, config.FAISS_INDEX_TYPE)
+            lexical = BM25Index()
+            lexical.add_documents(chunks)
+            return HybridRetriever(store, lexical)
+        times, retriever = timed(build, repeat)
+        record(results, "kb.build", times, len(chunks))
+
+        questions = load.questions()
+        times, _ = timed(lambda: [retriever.search(q, k=3) for q in questions], repeat)
+        record(results, "kb.query", times, len(questions))
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print median ratios against the baseline; return the names that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':<34}{'baseline ms':>12}{'current ms':>12}{'ratio':>8}")
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            print(f"{name:<34}{'-':>12}{current['median_s'] * 1000:>12.2f}{'new':>8}")
+            continue
+        ratio = current["median_s"] / previous["median_s"] if previous["median_s"] else float("inf")
+        flag = "  REGRESSION" if ratio > tolerance else ""
+        print(f"{name:<34}{previous['median_s'] * 1000:>12.2f}{current['median_s'] * 1000:>12.2f}{ratio:>8.2f}{flag}")
+        if ratio > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic-load benchmarks for the AquaGuard hot paths")
+    parser.add_argument("--regions", type=int, default=50)
+    parser.add_argument("--sectors", nargs="+", default=SECTORS, choices=SECTORS)
+    parser.add_argument("--cycles", type=int, default=12)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--documents", type=int, default=200, help="Synthetic regulation pages for the KB benchmarks")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-kb", action="store_true", help="Skip the knowledge base build/query benchmarks")
+    parser.add_argument("--shards", type=int, default=0, help="Also benchmark region-sharded allocation with N workers")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write this run's results")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="Allowed median slowdown vs the baseline")
+    args = parser.parse_args()
+
+    load = SyntheticLoad(args.regions, args.sectors, args.cycles, args.requests, args.documents, args.seed)
+    results = run_suite(load, args.repeat, args.skip_kb, args.shards)
+    report = {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "save_baseline")},
+        },
+        "results": results,
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"]["parameters"] != report["meta"]["parameters"]:
+            print("\nWarning: baseline was recorded with different parameters")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed beyond {args.tolerance:.2f}x: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,116 @@
 import streamlit as st
-from allocations import AllocationProcessor
+from config import KB_RELEVANCE_THRESHOLD
+from llm import get_llm_client, get_response_cache
+from health import get_monitor
+from tracing import span, traced
+from retrieval import chunk_id, embed_query, exact_terms, get_search_pool
 
 class ChatBot:
-    def __init__(self, kb, user_kb, water_alloc, drought_mode, ollama_available=True):
+    def __init__(self, kb, user_kb, water_alloc, drought_mode, ollama_available=None, embeddings=None, llm=None):
         self.kb = kb
         self.user_kb = user_kb
         self.water_alloc = water_alloc
         self.drought_mode = drought_mode
-        self.ollama_available = ollama_available
+        # None means "whatever the background health monitor last saw"
+        self.ollama_available = get_monitor().available if ollama_available is None else ollama_available
+        self.embeddings = embeddings
+        self.llm = llm
+        self.cache = get_response_cache()
         from allocations import AllocationProcessor
         self.processor = AllocationProcessor(water_alloc)
+
+    def ask_llm(self, prompt, question, docs=(), stream=False, vector=None, exact=False):
+        """Answer from the response cache when possible, otherwise from the pooled LLM client.
+
+        With stream=True a fresh answer comes back as a generator of tokens;
+        cached answers are always returned as text. exact=True (the docs came
+        from a clause/identifier lookup) keeps the question out of the
+        semantic tier, so it is never embedded."""
+        context_key = tuple(chunk_id(doc) for doc in docs)
+        answer = self.cache.get(question, context_key)
+        if answer is not None:
+            return answer
+
+        if not exact:
+            if vector is None and self.embeddings is not None:
+                vector = embed_query(self.embeddings, question)
+            if vector is not None:
+                answer = self.cache.get_similar(vector, context_key)
+                if answer is not None:
+                    return answer
+
+        llm = self.llm or get_llm_client()
+        if stream:
+            return self.stream_answer(llm, prompt, question, context_key, vector)
+        try:
+            with span("chat.llm"):
+                answer = llm.invoke(prompt)
+        except Exception:
+            get_monitor().report_failure()
+            raise
+        self.cache.put(question, context_key, answer, vector)
+        return answer
+
+    def retrieve(self, question, k=3):
+        """Search the knowledge base and the uploads (concurrently, with the
+        question embedded once) and merge the hits by score.
+
+        Clause/identifier questions are first answered from the inverted
+        indexes alone; the question is only embedded if that finds nothing.
+        Returns (source of the best hit, docs, question vector, exact)."""
+        stores = [(source, store) for source, store in (("kb", self.kb), ("rag", self.user_kb)) if store]
+        if stores and exact_terms(question):
+            merged = self.search_stores(stores, lambda store: store.exact_search(question, k), k)
+            if merged:
+                return merged[0][1], [doc for _, _, doc in merged], None, True
+
+        vector = None
+        if stores and self.embeddings is not None:
+            with span("chat.embed"):
+                vector = embed_query(self.embeddings, question)
+        merged = self.search_stores(stores, lambda store: store.search(question, k, vector), k)
+        if not merged:
+            return None, [], vector, False
+        return merged[0][1], [doc for _, _, doc in merged], vector, False
+
+    def search_stores(self, stores, search, k):
+        if len(stores) > 1:
+            pool = get_search_pool()
+            calls = [pool.submit(search, store).result for _, store in stores]
+        else:
+            calls = [lambda store=store: search(store) for _, store in stores]
+
+        merged = []
+        for (source, _), call in zip(stores, calls):
+            try:
+                with span("chat.search"):
+                    results = call()
+            except Exception as e:
+                print(f"{'KB' if source == 'kb' else 'User KB'} error: {e}")
+                continue
+            for doc, score in results:
+                # uploads have no relevance floor, the regulation library does
+                if source == "kb" and score <= KB_RELEVANCE_THRESHOLD:
+                    continue
+                merged.append((score, source, doc))
+
+        merged.sort(key=lambda hit: hit[0], reverse=True)
+        return merged[:k]
+
+    def stream_answer(self, llm, prompt, question, context_key, vector):
+        parts = []
+        try:
+            with span("chat.llm"):
+                for token in llm.stream(prompt):
+                    parts.append(token)
+                    yield token
+        except Exception:
+            get_monitor().report_failure()
+            raise
+        self.cache.put(question, context_key, "".join(parts), vector)
         
-    def hybrid_query(self, question):
+    @traced("chat.hybrid_query")
+    def hybrid_query(self, question, stream=False):
         
         if question.startswith("Request:") or question.startswith("request:"):
             req = question[8:].strip() if question.startswith("Request:") else question[9:].strip()
@@ -27,91 +126,87 @@ class ChatBot:
 
         
         try:
-        
-            if self.kb:
-                try:
-                    results = self.kb.similarity_search_with_relevance_scores(question, k=3)
-                    if results and len(results) > 0:
-                        relevant_docs = [doc for doc, score in results if score > 0.7]
-                        if relevant_docs:
-                            context = "\n\n".join([doc.page_content for doc in relevant_docs])
-                            
-                            if self.ollama_available:
-                                from langchain_community.llms import Ollama
-                                llm = Ollama(model="tinyllama")
-                                prompt = f"""Based on the following water regulation documents, please answer the question.
-                                If the answer cannot be found in the documents, say so.
-
-                                Documents:
-                                {context}
-
-                                Question: {question}
-
-                                Answer:"""
-                                response = llm.invoke(prompt)
-                                return response, "kb"
-                            else:
-                                return f"📚 From Knowledge Base:\n\n{context[:500]}...", "kb"
-                except Exception as e:
-                    print(f"KB error: {e}")
+            source, docs, vector, exact = self.retrieve(question)
+            if docs:
+                context = "\n\n".join(doc.page_content for doc in docs)
 
-        
-            if self.user_kb:
-                try:
-                    docs = self.user_kb.similarity_search(question, k=3)
-                    if docs:
-                        context = "\n\n".join(d.page_content for d in docs)
-                        if self.ollama_available:
-                            from langchain_community.llms import Ollama
-                            llm = Ollama(model="tinyllama")
-                            prompt = f"""Answer the question using only the context below.
-                            
-                            Context: {context}
-                            
-                            Question: {question}
-                            
-                            Answer:"""
-                            return llm.invoke(prompt), "rag"
-                        else:
-                            return f"📄 From Uploaded PDF:\n\n{context[:500]}...", "rag"
-                except Exception as e:
-                    print(f"User KB error: {e}")
+                if source == "kb":
+                    if self.ollama_available:
+                        prompt = f"""Based on the following water regulation documents, please answer the question.
+                        If the answer cannot be found in the documents, say so.
+
+                        Documents:
+                        {context}
+
+                        Question: {question}
+
+                        Answer:"""
+                        response = self.ask_llm(prompt, question, docs, stream, vector, exact)
+                        return response, "kb"
+                    else:
+                        return f"📚 From Knowledge Base:\n\n{context[:500]}...", "kb"
+
+                if self.ollama_available:
+                    prompt = f"""Answer the question using only the context below.
+                    
+                    Context: {context}
+                    
+                    Question: {question}
+                    
+                    Answer:"""
+                    return self.ask_llm(prompt, question, docs, stream, vector, exact), "rag"
+                else:
+                    return f"📄 From Uploaded PDF:\n\n{context[:500]}...", "rag"
 
             
             if self.ollama_available:
-                from langchain_community.llms import Ollama
-                llm = Ollama(model="tinyllama")
                 prompt = f"""You are AquaGuard, a helpful water allocation assistant. 
                 Answer the following question in a friendly, conversational way.
                 
                 Question: {question}
                 
                 Answer:"""
-                return llm.invoke(prompt), "llm"
+                return self.ask_llm(prompt, question, stream=stream, vector=vector), "llm"
             else:
                 return "I'm here to help with water allocation requests. You can ask me about water regulations or submit a request in the format: `Request: Region: id, Population: pop, Sector: sec, Volume: vol, Cycle: cyc`", "offline"
                 
         except Exception as e:
             return f"Sorry, I encountered an error: {str(e)}", "error"
     
+    def render_message(self, msg):
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+            if "source" in msg:
+                source_icons = {
+                    "kb": "📚 *Source: Knowledge Base*",
+                    "rag": "📄 *Source: Uploaded PDF*",
+                    "rejected": "❌ *Request Rejected*",
+                    "approved": "✅ *Request Approved*",
+                    "reduced": "⚠️ *Request Reduced*",
+                    "llm": "🤖 *Source: AI Assistant*",
+                    "offline": "💻 *Offline Mode*",
+                    "error": "⚠️ *Error*"
+                }
+                icon_text = source_icons.get(msg["source"], "💬 Response")
+                st.caption(icon_text)
+
     def render_chat(self):
-        
-        for msg in self.water_alloc.messages:
-            with st.chat_message(msg["role"]):
-                st.markdown(msg["content"])
-                if "source" in msg:
-                    source_icons = {
-                        "kb": "📚 *Source: Knowledge Base*",
-                        "rag": "📄 *Source: Uploaded PDF*",
-                        "rejected": "❌ *Request Rejected*",
-                        "approved": "✅ *Request Approved*",
-                        "reduced": "⚠️ *Request Reduced*",
-                        "llm": "🤖 *Source: AI Assistant*",
-                        "offline": "💻 *Offline Mode*",
-                        "error": "⚠️ *Error*"
-                    }
-                    icon_text = source_icons.get(msg["source"], "💬 Response")
-                    st.caption(icon_text)
+        messages = self.water_alloc.messages
+
+        # Only the in-memory window is rendered by default; older turns are
+        # paged in from the on-disk transcript when asked for
+        pages = st.session_state.get("chat_pages", 0)
+        earlier = messages.earlier(pages) if pages else []
+        hidden = messages.window_start - len(earlier)
+        if hidden > 0:
+            if st.button(f"⬆️ Load earlier messages ({hidden} more)", key="load_earlier"):
+                st.session_state.chat_pages = pages + 1
+                st.rerun()
+
+        for msg in earlier:
+            self.render_message(msg)
+        for msg in messages:
+            self.render_message(msg)
 
         
         prompt = st.chat_input("Submit request or ask a question...")
@@ -126,17 +221,24 @@ class ChatBot:
         
             with st.chat_message("assistant"):
                 with st.spinner("Thinking..."):
-                    answer, source = self.hybrid_query(prompt)
+                    answer, source = self.hybrid_query(prompt, stream=True)
                     
                     
-                    if source in ["approved", "reduced", "rejected"]:
-                        if source == "approved":
-                            st.success(answer)
-                        elif source == "reduced":
-                            st.warning(answer)
-                        else:
-                            st.error(answer)
+                if source in ["approved", "reduced", "rejected"]:
+                    if source == "approved":
+                        st.success(answer)
+                    elif source == "reduced":
+                        st.warning(answer)
                     else:
+                        st.error(answer)
+                elif isinstance(answer, str):
+                    st.markdown(answer)
+                else:
+                    # Tokens are rendered as the model produces them
+                    try:
+                        answer = st.write_stream(answer)
+                    except Exception as e:
+                        answer, source = f"Sorry, I encountered an error: {str(e)}", "error"
                         st.markdown(answer)
 
             
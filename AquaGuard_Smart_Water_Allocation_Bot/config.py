@@ -18,4 +18,100 @@ try:
 except PermissionError:
     print(f"Permission denied: Cannot create {KB_PDF_PATH}")
 except Exception as e:
-    print(f"Error creating directory: {e}")
\ No newline at end of file
+    print(f"Error creating directory: {e}")
+
+# Vector index settings. FAISS_INDEX_TYPE is one of flat, ivf_flat, ivf_pq,
+# ivf_sq, hnsw, hnsw_sq or sq (see vector_index.py); flat is exact search.
+FAISS_INDEX_TYPE = os.environ.get("AQUAGUARD_FAISS_INDEX", "flat")
+FAISS_NLIST = 1024
+FAISS_NPROBE = 16
+FAISS_PQ_M = 48
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_SEARCH = 64
+FAISS_TRAIN_SAMPLE = 50000
+
+# Hybrid retrieval: weight of the dense score against the normalised BM25 score,
+# how many candidates each side contributes per result, and the fused score a
+# knowledge base chunk needs to be used as context
+HYBRID_ALPHA = 0.7
+HYBRID_FETCH_K = 3
+KB_RELEVANCE_THRESHOLD = 0.5
+
+# Seconds the shared regulation index is kept after the last session using it
+# has gone; it is rebuilt by the next session that needs it
+KB_IDLE_RELEASE = 600
+
+# Local LLM backend and the process-wide response cache in front of it
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+LLM_MODEL = os.environ.get("AQUAGUARD_LLM_MODEL", "tinyllama")
+LLM_CACHE_SIZE = 512
+LLM_CACHE_TTL = 6 * 60 * 60
+LLM_SEMANTIC_THRESHOLD = 0.95
+
+# Query embedding LRU and the thread pool that searches the KB and uploads together
+QUERY_VECTOR_CACHE_SIZE = 1024
+SEARCH_WORKERS = 4
+
+# Chat history: messages kept in session memory, page size for "load earlier",
+# and where the per-session append-only transcripts are written
+CHAT_WINDOW = 50
+CHAT_PAGE_SIZE = 25
+TRANSCRIPT_DIR = os.path.join(BASE_DIR, "transcripts")
+# Transcripts untouched for this many seconds are deleted when a session starts
+TRANSCRIPT_TTL = 30 * 24 * 3600
+
+# Cold-start budgets enforced by `python diagnostics.py startup`: the imports
+# main.py performs before the first paint, and the first full run of main()
+# for every view except the chat view (which loads the embedding model)
+STARTUP_IMPORT_BUDGET_MS = 1500
+FIRST_RUN_BUDGET_MS = 5000
+
+# Views of the app, in selector order; the first is the chat view
+VIEWS = ["💬 Chat Assistant", "📊 Dashboard", "🎯 Simulation", "📋 Reports", "🔗 Audit Trail"]
+
+# Background LLM backend health monitor: probe interval while up, ceiling of
+# the exponential backoff while down, probe timeout and model warm-up timeout
+HEALTH_CHECK_INTERVAL = 15
+HEALTH_CHECK_MAX_BACKOFF = 120
+HEALTH_CHECK_TIMEOUT = 2
+LLM_WARMUP_TIMEOUT = 300
+HEALTH_FIRST_CHECK_WAIT = 0.5
+
+# Detailed report exports are written this many rows at a time
+EXPORT_CHUNK_ROWS = 50000
+# Finished exports are served from here by Streamlit's static file handler
+# (server.enableStaticServing, see .streamlit/config.toml) and removed after EXPORT_TTL seconds
+EXPORT_DIR = os.path.join(BASE_DIR, "static", "exports")
+EXPORT_TTL = 3600
+REPORT_PAGE_SIZES = [50, 100, 500]
+
+# Optional local webhook that receives every new alert as a JSON POST
+ALERT_WEBHOOK_URL = os.environ.get("AQUAGUARD_ALERT_WEBHOOK", "")
+
+# Dashboard: points kept when downsampling line charts, regions per page
+MAX_LINE_POINTS = 2000
+REGIONS_PER_PAGE = 25
+
+# Per-stage latency tracing (also switchable at runtime from the diagnostics
+# view, opened with ?diagnostics=1): rolling window per stage for the
+# percentiles, and where/how often the Prometheus/JSON metrics are written
+TRACE_ENABLED = os.environ.get("AQUAGUARD_TRACE", "0") == "1"
+TRACE_WINDOW = 1000
+TRACE_EXPORT_DIR = os.path.join(BASE_DIR, "metrics")
+TRACE_EXPORT_INTERVAL = 60
+
+# Region-sharded batch allocation (sharding.ShardRouter, `benchmark.py`):
+# worker processes the regions are partitioned across; 0 means one per CPU.
+# Interactive chat requests are always decided in the Streamlit process.
+ALLOCATION_SHARDS = int(os.environ.get("AQUAGUARD_ALLOCATION_SHARDS", "0"))
+
+# Binary snapshots of the session state (snapshot.py): where they are kept,
+# how often a rerun writes one, and the default snapshot name. The app keys
+# each operator's ledger by the ?ledger=<id> URL parameter and snapshots it
+# as ledger-<id>; a session restores only that ledger's snapshot + journal.
+SNAPSHOT_DIR = os.path.join(BASE_DIR, "snapshots")
+SNAPSHOT_INTERVAL = 300
+SNAPSHOT_NAME = "latest"
+# Snapshots and journals of ledgers untouched for this many seconds are deleted
+# (with their transcript) when a session starts
+SNAPSHOT_TTL = 30 * 24 * 3600
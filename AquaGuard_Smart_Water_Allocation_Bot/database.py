@@ -1,20 +1,33 @@
 import os
-import tempfile
+import io
+import hashlib
+import threading
+import weakref
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from config import KB_PDF_PATH
+from pypdf import PdfReader
+from config import KB_PDF_PATH, FAISS_INDEX_TYPE, KB_IDLE_RELEASE
+from vector_index import build_vector_store
+from tracing import traced
+from retrieval import BM25Index, HybridRetriever, chunk_id
 
 class KnowledgeBase:
     def __init__(self, embeddings):
         self.embeddings = embeddings
         self.kb_db = None
         self.user_db = None
-        
+        self.kb_lexical = BM25Index()
+        self.user_lexical = BM25Index()
+        self.uploads = {}  # content hash -> file name of every PDF already in user_db
+        self.upload_chunks = {}  # content hash -> the chunks it added
+
+    @traced("kb.build")
     def build_kb_vector_db(self):
         if self.embeddings is None:
             return None
-        
+
         docs = []
         # Check if directory exists and has PDFs
         if os.path.exists(KB_PDF_PATH):
@@ -27,45 +40,171 @@ class KnowledgeBase:
                     except Exception as e:
                         print(f"Error loading {file}: {e}")
                         continue
-        
+
         if not docs:
             return None
-            
+
         splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=50)
         chunks = splitter.split_documents(docs)
-        self.kb_db = FAISS.from_documents(chunks, self.embeddings)
+        for chunk in chunks:
+            chunk_id(chunk)
+        self.kb_db = build_vector_store(chunks, self.embeddings, FAISS_INDEX_TYPE)
+        self.kb_lexical = BM25Index()
+        self.kb_lexical.add_documents(chunks)
         return self.kb_db
 
+    def kb_retriever(self):
+        return HybridRetriever(self.kb_db, self.kb_lexical) if self.kb_db else None
+
+    def user_retriever(self):
+        return HybridRetriever(self.user_db, self.user_lexical) if self.user_db else None
+
+    def load_pdf_bytes(self, data, name):
+        """Parse a PDF straight from memory into one Document per page."""
+        reader = PdfReader(io.BytesIO(data))
+        docs = []
+        for page_number, page in enumerate(reader.pages):
+            text = page.extract_text() or ""
+            if text.strip():
+                docs.append(Document(page_content=text, metadata={"source": name, "page": page_number}))
+        return docs
+
+    @traced("kb.upload")
     def process_uploaded_file(self, uploaded_file):
         if self.embeddings is None:
             return None
-        
-        # Use tempfile with proper cleanup
-        tmp_path = None
+
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=tempfile.gettempdir()) as tmp:
-                tmp.write(uploaded_file.getvalue())
-                tmp_path = tmp.name
+            data = uploaded_file.getvalue()
+            digest = hashlib.sha256(data).hexdigest()
+
+            # Streamlit reruns the script on every interaction; an upload we have
+            # already indexed is served from the existing index.
+            if digest in self.uploads:
+                return self.user_db
 
-            loader = PyPDFLoader(tmp_path)
-            docs = loader.load()
-            
+            docs = self.load_pdf_bytes(data, uploaded_file.name)
             if not docs:
                 return None
-                
+
             splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=50)
             chunks = splitter.split_documents(docs)
-            self.user_db = FAISS.from_documents(chunks, self.embeddings)
+            for chunk in chunks:
+                chunk.metadata["upload_hash"] = digest
+                chunk_id(chunk)
+            # docstore ids, so the upload's vectors can be deleted again
+            ids = [f"{digest}:{i}" for i in range(len(chunks))]
+
+            if self.user_db is None:
+                self.user_db = FAISS.from_documents(chunks, self.embeddings, ids=ids)
+            else:
+                self.user_db.add_documents(chunks, ids=ids)
+            self.user_lexical.add_documents(chunks)
+            self.uploads[digest] = uploaded_file.name
+            self.upload_chunks[digest] = chunks
             return self.user_db
-            
+
         except Exception as e:
             print(f"Error processing file: {e}")
             return None
-            
-        finally:
-            # Clean up temp file
-            if tmp_path and os.path.exists(tmp_path):
-                try:
-                    os.unlink(tmp_path)
-                except:
-                    pass
\ No newline at end of file
+
+    def retain_uploads(self, uploaded_files):
+        """Drop every indexed upload that is no longer among uploaded_files.
+
+        The removed chunks are deleted from the FAISS store by id; the BM25
+        side is rebuilt from the chunks of the remaining uploads."""
+        keep = {hashlib.sha256(f.getvalue()).hexdigest() for f in uploaded_files}
+        removed = [digest for digest in self.uploads if digest not in keep]
+        if not removed:
+            return
+        for digest in removed:
+            del self.uploads[digest]
+            chunks = self.upload_chunks.pop(digest)
+            if self.uploads:
+                self.user_db.delete([f"{digest}:{i}" for i in range(len(chunks))])
+        if not self.uploads:
+            self.user_db = None
+        self.user_lexical = BM25Index()
+        self.user_lexical.add_documents([chunk for chunks in self.upload_chunks.values() for chunk in chunks])
+
+
+class KnowledgeBaseService:
+    """The regulation library index, built once per process and shared by every session.
+
+    The current retriever is an immutable snapshot: a rebuild prepares a new
+    one off to the side and swaps the reference in a single assignment, so
+    queries already holding the old snapshot finish on it undisturbed.
+    Searches on a snapshot are read-only and safe from several threads.
+    load_embeddings is only called when the index is first built.
+
+    Sessions using the index hold leases. Once the last lease has been
+    released for `idle_release` seconds the index is dropped, and the next
+    session that needs it builds it again."""
+
+    def __init__(self, load_embeddings, idle_release=KB_IDLE_RELEASE):
+        self.load_embeddings = load_embeddings
+        self.idle_release = idle_release
+        self.retriever = None
+        self.version = 0
+        self.leases = 0
+        self.built = False
+        self._idle_timer = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def acquire(self):
+        """Register a session; the lease is released when the session's state is dropped."""
+        with self._lock:
+            self.leases += 1
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+        return KnowledgeBaseLease(self)
+
+    def release(self):
+        with self._lock:
+            self.leases = max(0, self.leases - 1)
+            if self.leases == 0 and self.built:
+                self._idle_timer = threading.Timer(self.idle_release, self._release_if_idle)
+                self._idle_timer.daemon = True
+                self._idle_timer.start()
+
+    def _release_if_idle(self):
+        with self._build_lock, self._lock:
+            if self.leases == 0:
+                # queries still holding the old retriever keep it alive until they finish
+                self.retriever = None
+                self.built = False
+                self._idle_timer = None
+
+    def ensure_built(self):
+        if not self.built:
+            with self._build_lock:
+                if not self.built:
+                    self._swap(self._build())
+        return self.retriever
+
+    def rebuild(self):
+        with self._build_lock:
+            self._swap(self._build())
+        return self.retriever
+
+    def _build(self):
+        builder = KnowledgeBase(self.load_embeddings())
+        builder.build_kb_vector_db()
+        return builder.kb_retriever()
+
+    def _swap(self, retriever):
+        with self._lock:
+            self.retriever = retriever
+            self.version += 1
+            self.built = True
+
+
+class KnowledgeBaseLease:
+    def __init__(self, service):
+        self.service = service
+        self._finalizer = weakref.finalize(self, service.release)
+
+    def release(self):
+        self._finalizer()
@@ -0,0 +1,165 @@
+import re
+import sys
+import json
+import argparse
+import subprocess
+from config import BASE_DIR, STARTUP_IMPORT_BUDGET_MS, FIRST_RUN_BUDGET_MS, VIEWS
+
+# `main` is what Streamlit imports before the first paint; the rest are the
+# subsystems main.py now imports lazily, profiled separately for reference
+STARTUP_MODULE = "main"
+SUBSYSTEMS = {
+    "chat": "chatbot",
+    "knowledge base": "database",
+    "embeddings": "langchain_community.embeddings",
+    "analytics": "analytics",
+    "dashboard": "visualizations",
+    "simulation": "simulation",
+    "reports": "reports",
+}
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)")
+
+# Runs main.py once, headless, with the given view selected and prints the
+# wall time of that first run plus any exceptions it rendered
+FIRST_RUN_SCRIPT = """
+import json, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("main.py", default_timeout={timeout})
+app.session_state["active_view"] = {view!r}
+start = time.perf_counter()
+app.run()
+print(json.dumps({{"ms": (time.perf_counter() - start) * 1000, "errors": [e.message for e in app.exception]}}))
+"""
+
+
+def profile_import(module):
+    """Import `module` in a fresh interpreter under -X importtime.
+
+    Returns a list of (package, self_us, cumulative_us, depth)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BASE_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, package = match.groups()
+            entries.append((package, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return entries
+
+
+def profile_first_run(view, timeout=600):
+    """Time the first run of main() with `view` selected, in a fresh interpreter.
+
+    Returns {"ms": wall time, "errors": exception messages shown by the app}."""
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_RUN_SCRIPT.format(view=view, timeout=timeout)],
+        cwd=BASE_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"first run of {view} failed:\n{result.stderr.strip().splitlines()[-1]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def total_ms(entries):
+    return sum(cumulative for _, _, cumulative, depth in entries if depth == 0) / 1000
+
+
+def startup_report(top=15, budget_ms=STARTUP_IMPORT_BUDGET_MS, first_run_budget_ms=FIRST_RUN_BUDGET_MS):
+    """Print the import and first-run breakdown; return the budget failures."""
+    failures = []
+    entries = profile_import(STARTUP_MODULE)
+    startup = total_ms(entries)
+
+    print(f"Cold-start imports ({STARTUP_MODULE}): {startup:,.0f} ms (budget {budget_ms:,} ms)")
+    print(f"\n{'cumulative ms':>14}{'self ms':>10}  package")
+    for package, self_us, cumulative_us, depth in sorted(entries, key=lambda e: e[2], reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>14,.1f}{self_us / 1000:>10,.1f}  {'  ' * depth}{package}")
+
+    print(f"\n{'subsystem':<16}{'module':<34}{'import ms':>10}")
+    for name, module in SUBSYSTEMS.items():
+        try:
+            print(f"{name:<16}{module:<34}{total_ms(profile_import(module)):>10,.0f}")
+        except RuntimeError as e:
+            print(f"{name:<16}{module:<34}{'n/a':>10}  {e}")
+    if startup > budget_ms:
+        failures.append(f"cold-start imports take {startup:,.0f} ms, over the {budget_ms:,} ms budget")
+
+    # The chat view loads the embedding model and the index by design; every
+    # other view must not wait on them
+    print(f"\n{'first run of main()':<24}{'ms':>10}  (budget {first_run_budget_ms:,} ms, chat view not gated)")
+    for index, view in enumerate(VIEWS):
+        try:
+            run = profile_first_run(view)
+        except RuntimeError as e:
+            failures.append(str(e))
+            print(f"{view:<24}{'n/a':>10}  {e}")
+            continue
+        print(f"{view:<24}{run['ms']:>10,.0f}" + "".join(f"\n{'':<26}error: {error}" for error in run["errors"]))
+        if run["errors"]:
+            failures.append(f"first run of {view} raised: {run['errors'][0]}")
+        elif index and run["ms"] > first_run_budget_ms:
+            failures.append(f"first run of {view} takes {run['ms']:,.0f} ms, over the {first_run_budget_ms:,} ms budget")
+
+    return failures
+
+
+def render_diagnostics():
+    """Hidden in-app performance panel (open the app with ?diagnostics=1)."""
+    import streamlit as st
+    import pandas as pd
+    from tracing import tracer
+    from health import get_monitor
+
+    st.subheader("🩺 Diagnostics")
+    tracer.enabled = st.toggle("Record stage latencies", tracer.enabled)
+
+    summary = tracer.summary()
+    if summary:
+        df = pd.DataFrame.from_dict(summary, orient="index")
+        df.index.name = "stage"
+        st.dataframe(
+            df[["count", "p50_ms", "p95_ms", "p99_ms", "max_ms", "total_s"]].sort_values("p95_ms", ascending=False),
+            use_container_width=True
+        )
+    else:
+        st.info("No spans recorded yet. Enable recording and use the app.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Export metrics", use_container_width=True):
+            for path in tracer.export():
+                st.caption(f"Wrote {path}")
+    with col2:
+        if st.button("Reset", use_container_width=True):
+            tracer.reset()
+            st.rerun()
+
+    st.caption("LLM backend")
+    st.json(get_monitor().status())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AquaGuard diagnostics")
+    commands = parser.add_subparsers(dest="command", required=True)
+    startup = commands.add_parser("startup", help="Import-time breakdown of app start-up")
+    startup.add_argument("--top", type=int, default=15, help="Number of slowest imports to list")
+    startup.add_argument("--budget-ms", type=int, default=STARTUP_IMPORT_BUDGET_MS)
+    startup.add_argument("--first-run-budget-ms", type=int, default=FIRST_RUN_BUDGET_MS)
+    args = parser.parse_args()
+
+    if args.command == "startup":
+        failures = startup_report(args.top, args.budget_ms, args.first_run_budget_ms)
+        if failures:
+            print("".join(f"\nFAIL: {failure}" for failure in failures))
+            sys.exit(1)
+        print("\nOK: cold-start imports and first runs within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import os
+import gzip
+import time
+import tempfile
+from uuid import uuid4
+from bisect import bisect_left, bisect_right
+import pandas as pd
+from config import EXPORT_CHUNK_ROWS, EXPORT_DIR, EXPORT_TTL
+
+LOG_COLUMNS = ["timestamp", "region", "sector", "allocated", "decision", "reason", "cycle", "requested"]
+
+# label -> (file extension, mime type)
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "CSV (gzip)": (".csv.gz", "application/gzip"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+    "Arrow IPC": (".arrow", "application/vnd.apache.arrow.file"),
+}
+
+
+def filter_log_indices(logs, regions=None, cycles=None, start=None, end=None):
+    """Positions of the log entries that pass the filters, without copying any entry.
+
+    Logs are appended in time order, so a time window is located by bisection
+    and only the entries inside it are visited."""
+    lo, hi = 0, len(logs)
+    if start is not None:
+        lo = bisect_left(logs, start, key=lambda entry: entry["timestamp"])
+    if end is not None:
+        hi = bisect_right(logs, end, lo=lo, key=lambda entry: entry["timestamp"])
+    if not regions and not cycles:
+        return range(lo, hi)
+
+    regions = set(regions) if regions else None
+    cycles = set(cycles) if cycles else None
+    return [
+        i for i in range(lo, hi)
+        if (regions is None or logs[i]["region"] in regions)
+        and (cycles is None or logs[i]["cycle"] in cycles)
+    ]
+
+
+def logs_frame(logs, indices):
+    return pd.DataFrame([logs[i] for i in indices], columns=LOG_COLUMNS)
+
+
+def iter_log_chunks(logs, indices, chunk_size=EXPORT_CHUNK_ROWS):
+    """DataFrames of at most chunk_size rows covering `indices` in order."""
+    for start in range(0, len(indices), chunk_size):
+        yield logs_frame(logs, indices[start:start + chunk_size])
+
+
+def arrow_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("timestamp", pa.float64()),
+        ("region", pa.int64()),
+        ("sector", pa.string()),
+        ("allocated", pa.float64()),
+        ("decision", pa.string()),
+        ("reason", pa.string()),
+        ("cycle", pa.int64()),
+        ("requested", pa.float64()),
+    ])
+
+
+def write_export(logs, indices, fmt, path, chunk_size=EXPORT_CHUNK_ROWS):
+    """Stream the selected log entries to `path` one chunk at a time.
+
+    Only one chunk is ever materialised as a DataFrame. Returns the row count."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Must be one of {', '.join(EXPORT_FORMATS)}")
+
+    rows = 0
+    if fmt in ("CSV", "CSV (gzip)"):
+        opener = gzip.open if fmt == "CSV (gzip)" else open
+        with opener(path, "wt", newline="") as f:
+            pd.DataFrame(columns=LOG_COLUMNS).to_csv(f, index=False)
+            for chunk in iter_log_chunks(logs, indices, chunk_size):
+                chunk.to_csv(f, index=False, header=False)
+                rows += len(chunk)
+        return rows
+
+    import pyarrow as pa
+    schema = arrow_schema()
+    if fmt == "Parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(path, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_file(path, schema)
+    with writer:
+        for chunk in iter_log_chunks(logs, indices, chunk_size):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+    return rows
+
+
+def export_to_tempfile(logs, indices, fmt, chunk_size=EXPORT_CHUNK_ROWS):
+    """Write an export to a temporary file and return its path; the caller removes it."""
+    suffix = EXPORT_FORMATS[fmt][0]
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="aquaguard_export_")
+    os.close(fd)
+    try:
+        write_export(logs, indices, fmt, path, chunk_size)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def expire_exports(directory=EXPORT_DIR, ttl=EXPORT_TTL):
+    """Remove published exports older than ttl seconds."""
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - ttl
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def publish_export(logs, indices, fmt, directory=EXPORT_DIR, chunk_size=EXPORT_CHUNK_ROWS):
+    """Write an export into the static directory under an unguessable name and
+    return that name. The file is streamed from disk by the static file handler,
+    so it never has to be loaded into the app's memory."""
+    expire_exports(directory)
+    os.makedirs(directory, exist_ok=True)
+    name = uuid4().hex + EXPORT_FORMATS[fmt][0]
+    path = os.path.join(directory, name)
+    # write under a hidden name so a half-written file is never served
+    partial = os.path.join(directory, "." + name)
+    try:
+        write_export(logs, indices, fmt, partial, chunk_size)
+        os.replace(partial, path)
+    except Exception:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return name
@@ -0,0 +1,134 @@
+import json
+import time
+import threading
+import urllib.request
+from config import (
+    OLLAMA_HOST, LLM_MODEL, HEALTH_CHECK_INTERVAL, HEALTH_CHECK_MAX_BACKOFF,
+    HEALTH_CHECK_TIMEOUT, LLM_WARMUP_TIMEOUT
+)
+
+
+class BackendMonitor:
+    """Probes the local LLM backend from a daemon thread.
+
+    The result of the last probe is published as plain attributes, so the
+    UI and the chatbot read it without ever waiting on the network. While
+    the backend is down the probe interval backs off exponentially; when it
+    comes (back) up the model is loaded once, on a separate one-off thread
+    so probing carries on meanwhile, and the first question does not pay for it."""
+
+    def __init__(self, host=OLLAMA_HOST, model=LLM_MODEL, interval=HEALTH_CHECK_INTERVAL,
+                 max_backoff=HEALTH_CHECK_MAX_BACKOFF, timeout=HEALTH_CHECK_TIMEOUT, warm=True):
+        self.host = host.rstrip("/")
+        self.model = model
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.warm = warm
+        self.available = False
+        self.warmed = False
+        self.last_checked = None
+        self.last_error = None
+        self.failures = 0
+        self.checked = threading.Event()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._warm_thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="llm-health", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def probe(self):
+        try:
+            with urllib.request.urlopen(f"{self.host}/api/tags", timeout=self.timeout) as response:
+                return response.status == 200, None
+        except Exception as e:
+            return False, str(e)
+
+    def warm_model(self):
+        # An empty prompt makes Ollama load the model into memory without generating
+        body = json.dumps({"model": self.model, "prompt": "", "stream": False}).encode()
+        request = urllib.request.Request(
+            f"{self.host}/api/generate", data=body, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=LLM_WARMUP_TIMEOUT) as response:
+                return response.status == 200
+        except Exception as e:
+            print(f"Model warm-up failed: {e}")
+            return False
+
+    def _run(self):
+        delay = self.interval
+        while not self._stop.is_set():
+            ok, error = self.probe()
+            self.available = ok
+            self.last_error = error
+            self.last_checked = time.time()
+            self.checked.set()
+
+            if ok:
+                self.failures = 0
+                delay = self.interval
+                if self.warm and not self.warmed:
+                    self._start_warmup()
+            else:
+                self.failures += 1
+                self.warmed = False
+                delay = min(self.interval * 2 ** (self.failures - 1), self.max_backoff)
+
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def _start_warmup(self):
+        with self._lock:
+            if self._warm_thread is None or not self._warm_thread.is_alive():
+                self._warm_thread = threading.Thread(target=self._warm, name="llm-warmup", daemon=True)
+                self._warm_thread.start()
+
+    def _warm(self):
+        warmed = self.warm_model()
+        # the backend may have gone down while the model was loading
+        self.warmed = warmed and self.available
+
+    def report_failure(self):
+        """Called when a request to the backend fails: mark it down and re-probe now."""
+        self.available = False
+        self._wake.set()
+
+    def wait_until_checked(self, timeout):
+        """Block (at most `timeout` seconds) until the first probe has finished."""
+        return self.checked.wait(timeout)
+
+    def status(self):
+        return {
+            "available": self.available,
+            "warmed": self.warmed,
+            "last_checked": self.last_checked,
+            "last_error": self.last_error,
+            "failures": self.failures
+        }
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_monitor():
+    """Process-wide backend monitor, started on first use."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = BackendMonitor().start()
+        return _monitor
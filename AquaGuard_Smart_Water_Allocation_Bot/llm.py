@@ -0,0 +1,121 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import OLLAMA_HOST, LLM_MODEL, LLM_CACHE_SIZE, LLM_CACHE_TTL, LLM_SEMANTIC_THRESHOLD
+
+
+class LLMClient:
+    """Wraps one ollama.Client so every question reuses its pooled HTTP connections.
+
+    ChatBot only needs invoke(prompt) -> str and stream(prompt) -> iterator of
+    tokens, so any object with those two methods (e.g. a fake LLM) can stand in."""
+
+    def __init__(self, host=OLLAMA_HOST, model=LLM_MODEL):
+        import ollama
+        self.model = model
+        self.client = ollama.Client(host=host)
+
+    def invoke(self, prompt):
+        return self.client.generate(model=self.model, prompt=prompt)["response"]
+
+    def stream(self, prompt):
+        for part in self.client.generate(model=self.model, prompt=prompt, stream=True):
+            yield part["response"]
+
+
+def normalize_question(question):
+    return " ".join(re.findall(r"\w+", question.lower()))
+
+
+class ResponseCache:
+    """LRU + TTL cache of LLM answers keyed by (normalised question, context chunk ids).
+
+    A second, semantic tier reuses the answer of a near-duplicate question
+    (cosine similarity of the question embeddings >= threshold) asked over
+    the same context."""
+
+    def __init__(self, max_entries=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL, semantic_threshold=LLM_SEMANTIC_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self.entries = OrderedDict()  # key -> (answer, unit question vector or None, expires at)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _live(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] < now:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def get(self, question, context_key):
+        key = (normalize_question(question), context_key)
+        with self.lock:
+            entry = self._live(key, time.time())
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+        return None
+
+    def get_similar(self, vector, context_key):
+        query = _unit(vector)
+        now = time.time()
+        with self.lock:
+            best_key, best_score = None, self.semantic_threshold
+            for key, (answer, cached_vector, expires) in self.entries.items():
+                if key[1] != context_key or cached_vector is None or expires < now:
+                    continue
+                score = float(np.dot(query, cached_vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is not None:
+                self.semantic_hits += 1
+                self.entries.move_to_end(best_key)
+                return self.entries[best_key][0]
+            self.misses += 1
+        return None
+
+    def put(self, question, context_key, answer, vector=None):
+        key = (normalize_question(question), context_key)
+        with self.lock:
+            self.entries[key] = (answer, _unit(vector) if vector is not None else None, time.time() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype="float32")
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+_client = None
+_cache = None
+_lock = threading.Lock()
+
+
+def get_llm_client():
+    """Process-wide LLM client shared by every session."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
+
+
+def get_response_cache():
+    """Process-wide response cache shared by every session."""
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
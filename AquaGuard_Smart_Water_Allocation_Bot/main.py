@@ -1,22 +1,22 @@
 import streamlit as st
 import os
+import re
 import sys
+import time
+import uuid
 
-# Add error handling for imports
-try:
-    from langchain_community.embeddings import HuggingFaceEmbeddings
-except ImportError:
-    st.error("Please install required packages: pip install langchain-community sentence-transformers")
-    st.stop()
-
+# Only lightweight modules are imported up front. langchain, FAISS,
+# sentence-transformers, scikit-learn, plotly and pandas are imported by the
+# feature that needs them (see `python diagnostics.py startup`).
 from models import WaterAllocation
-from database import KnowledgeBase
-from analytics import Analytics
-from visualizations import Dashboard
 from alerts import AlertSystem
-from reports import ReportGenerator
-from simulation import ScenarioSimulator
-from chatbot import ChatBot
+from transcript import ChatTranscript, expire_transcripts
+from health import get_monitor
+from config import HEALTH_FIRST_CHECK_WAIT, VIEWS
+from tracing import tracer
+
+CHAT_VIEW = VIEWS[0]
+LEDGER_ID = re.compile(r"[0-9a-f]{32}")
 
 st.set_page_config(
     page_title="AquaGuard - Smart Water Management",
@@ -28,6 +28,13 @@ st.title("💧 AquaGuard – Smart Water Allocation & Compliance System")
 
 @st.cache_resource
 def load_embeddings():
+    # Add error handling for imports
+    try:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+    except ImportError:
+        st.error("Please install required packages: pip install langchain-community sentence-transformers")
+        st.stop()
+
     try:
         return HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
     except Exception as e:
@@ -35,64 +42,151 @@ def load_embeddings():
         st.info("The app will run with limited functionality (no document search)")
         return None
 
+@st.cache_resource
+def get_kb_service():
+    from database import KnowledgeBaseService
+    # embeddings are only loaded when the index is first built
+    return KnowledgeBaseService(load_embeddings)
+
+def get_session_kb():
+    """The session's upload index, created (with the embedding model) on first use."""
+    if "knowledge_base" not in st.session_state:
+        from database import KnowledgeBase
+        st.session_state.knowledge_base = KnowledgeBase(load_embeddings())
+    return st.session_state.knowledge_base
+
+def new_water_allocation(ledger_id):
+    water_alloc = WaterAllocation()
+    # The live transcript is named after the ledger, so a chat comes back with
+    # the ledger even before its first snapshot
+    water_alloc.messages = ChatTranscript(ledger_id)
+    return water_alloc
+
+def ledger_snapshot_names():
+    """(live, undo-reset) snapshot names of this operator's ledger.
+
+    The ledger id is kept in the page URL (?ledger=...), so a reload or a
+    bookmark restores the same ledger; sessions with the same id share it
+    through the ledger registry."""
+    if "ledger_id" not in st.session_state:
+        requested = st.query_params.get("ledger", "")
+        st.session_state.ledger_id = requested if LEDGER_ID.fullmatch(requested) else uuid.uuid4().hex
+    if st.query_params.get("ledger") != st.session_state.ledger_id:
+        st.query_params["ledger"] = st.session_state.ledger_id
+    from snapshot import RESET_SNAPSHOT
+    return f"ledger-{st.session_state.ledger_id}", f"{RESET_SNAPSHOT}-{st.session_state.ledger_id}"
+
+def open_ledger(ledger_id):
+    """Pick up where the ledger's last session (or server run) left off."""
+    from snapshot import load_snapshot, attach_journal
+    name = f"ledger-{ledger_id}"
+    try:
+        water_alloc = load_snapshot(name, session_id=ledger_id)
+    except (OSError, ValueError) as e:
+        print(f"Snapshot restore failed: {e}")
+        water_alloc = None
+    if water_alloc is None:
+        # nothing is written until the ledger has an allocation
+        water_alloc = new_water_allocation(ledger_id)
+    attach_journal(water_alloc, name)
+    return water_alloc
+
+@st.cache_resource
+def get_ledger_registry():
+    from snapshot import LedgerRegistry
+    return LedgerRegistry(open_ledger)
+
+def start_session(water_alloc):
+    """Make water_alloc the ledger of every session sharing this ledger id (reset / undo)."""
+    from snapshot import attach_journal
+    attach_journal(water_alloc, ledger_snapshot_names()[0])
+    get_ledger_registry().replace(st.session_state.ledger_id, water_alloc)
+    st.session_state.water_alloc = water_alloc
+    st.session_state.chat_pages = 0
+
 def initialize_session_state():
-    if "water_alloc" not in st.session_state:
-        st.session_state.water_alloc = WaterAllocation()
-        st.session_state.water_alloc.messages = []
+    ledger_snapshot_names()
+    registry = get_ledger_registry()
+    if "ledger_lease" not in st.session_state:
+        from snapshot import RESET_SNAPSHOT, expire_snapshots
+        open_ids = registry.open_ids() | {st.session_state.ledger_id}
+        expire_snapshots(keep={f"{prefix}-{ledger_id}" for ledger_id in open_ids for prefix in ("ledger", RESET_SNAPSHOT)})
+        expire_transcripts()
+        st.session_state.ledger_lease = registry.acquire(st.session_state.ledger_id)
+    # every session of a ledger id shares one WaterAllocation; a reset or undo
+    # in one of them swaps it for all
+    water_alloc = registry.get(st.session_state.ledger_id)
+    if st.session_state.get("water_alloc") is not water_alloc:
+        st.session_state.water_alloc = water_alloc
+        st.session_state.chat_pages = 0
     if "drought_mode" not in st.session_state:
         st.session_state.drought_mode = False
 
-def check_ollama():
-    """Check if Ollama is available"""
-    try:
-        import requests
-        response = requests.get("http://localhost:11434/api/tags", timeout=2)
-        return response.status_code == 200
-    except:
-        return False
-
 def main():
     initialize_session_state()
     
-    # Check Ollama status
-    ollama_available = check_ollama()
+    # Check Ollama status; the monitor probes in the background, so this only
+    # ever waits (briefly) for the very first probe of the process
+    monitor = get_monitor()
+    monitor.wait_until_checked(HEALTH_FIRST_CHECK_WAIT)
+    ollama_available = monitor.available
     if not ollama_available:
         st.sidebar.warning("⚠️ Ollama not detected. LLM features will be limited.")
     
-    embeddings = load_embeddings()
+    # The embedding model, the regulation index and langchain are only
+    # loaded for the chat view (or an upload); the other views never wait on them
+    view = st.session_state.get("active_view", CHAT_VIEW)
+    kb_retriever = None
     
     with st.sidebar:
         st.header("⚙️ Configuration")
         st.session_state.drought_mode = st.toggle("Drought Mode", st.session_state.drought_mode)
         st.divider()
         
-        # Initialize KB with error handling
-        kb = KnowledgeBase(embeddings)
-        with st.spinner("Loading Knowledge Base..."):
-            try:
-                kb_db = kb.build_kb_vector_db()
-                if kb_db:
-                    st.success("✅ Knowledge Base loaded")
-                else:
-                    st.info("ℹ️ No PDFs found in kb_pdfs folder")
-            except Exception as e:
-                st.error(f"Error loading KB: {e}")
-                kb_db = None
+        # The regulation library index is shared by every session in the
+        # process; each session holds a lease on it
+        if view == CHAT_VIEW:
+            kb_service = get_kb_service()
+            if "kb_lease" not in st.session_state:
+                st.session_state.kb_lease = kb_service.acquire()
+            with st.spinner("Loading Knowledge Base..."):
+                try:
+                    kb_retriever = kb_service.ensure_built()
+                    if kb_retriever:
+                        st.success("✅ Knowledge Base loaded")
+                    else:
+                        st.info("ℹ️ No PDFs found in kb_pdfs folder")
+                except Exception as e:
+                    st.error(f"Error loading KB: {e}")
+                    kb_retriever = None
+            if st.button("♻️ Rebuild Knowledge Base", use_container_width=True):
+                with st.spinner("Rebuilding Knowledge Base..."):
+                    try:
+                        kb_retriever = kb_service.rebuild()
+                    except Exception as e:
+                        st.error(f"Error rebuilding KB: {e}")
+            st.caption(f"Index v{kb_service.version} · shared by {kb_service.leases} session(s)")
+        else:
+            st.caption("📚 The Knowledge Base loads with the Chat Assistant")
         
         st.divider()
         
-        # File uploader with better error handling
-        uploaded_file = st.file_uploader("Upload PDF", type="pdf")
-        if uploaded_file is not None:
-            with st.spinner("Processing PDF..."):
+        # Uploads stay private to the session; its KnowledgeBase keeps them
+        # in a single incremental index
+        uploaded_files = st.file_uploader("Upload PDF", type="pdf", accept_multiple_files=True)
+        for uploaded_file in uploaded_files or []:
+            with st.spinner(f"Processing {uploaded_file.name}..."):
                 try:
-                    result = kb.process_uploaded_file(uploaded_file)
+                    result = get_session_kb().process_uploaded_file(uploaded_file)
                     if result:
                         st.success(f"✅ {uploaded_file.name} uploaded successfully")
                     else:
-                        st.error("Failed to process PDF")
+                        st.error(f"Failed to process {uploaded_file.name}")
                 except Exception as e:
                     st.error(f"Error: {e}")
+        # a file removed from the uploader stops being used for answers
+        if "knowledge_base" in st.session_state:
+            st.session_state.knowledge_base.retain_uploads(uploaded_files or [])
         
         st.divider()
         
@@ -100,46 +194,99 @@ def main():
         alert_system = AlertSystem(st.session_state.water_alloc)
         alert_system.render_sidebar()
         
+        # Snapshots: written periodically at the end of a rerun, on demand,
+        # and before a reset so the reset can be undone
+        from snapshot import save_snapshot, load_snapshot, snapshot_exists, discard_snapshot
+        snapshot_name, reset_snapshot = ledger_snapshot_names()
+        if st.button("💾 Snapshot Now", use_container_width=True):
+            try:
+                save_snapshot(st.session_state.water_alloc, snapshot_name)
+            except (OSError, ValueError) as e:
+                st.error(f"Snapshot failed: {e}")
+        taken_at, version = getattr(st.session_state.water_alloc, "snapshot_info", (None, 0))
+        if taken_at:
+            st.caption(f"Last snapshot {time.strftime('%H:%M:%S', time.localtime(taken_at))} · {version} entries")
+        
         # Reset button
         if st.button("🔄 Reset System", use_container_width=True):
-            st.session_state.water_alloc = WaterAllocation()
-            st.session_state.water_alloc.messages = []
+            # only one reset can be undone; an older undo point goes with its transcript
+            discard_snapshot(reset_snapshot, transcript=True)
+            old = st.session_state.water_alloc
+            if old.logs or len(old.messages):
+                # the undo point keeps the old chat under its own transcript id
+                old.messages.rename(uuid.uuid4().hex)
+                try:
+                    save_snapshot(old, reset_snapshot)
+                except (OSError, ValueError) as e:
+                    print(f"Snapshot failed, the reset cannot be undone: {e}")
+                    old.messages.clear()
+            # the fresh ledger is empty, so it has no snapshot or journal yet
+            discard_snapshot(snapshot_name)
+            start_session(new_water_allocation(st.session_state.ledger_id))
             st.rerun()
+        if snapshot_exists(reset_snapshot):
+            if st.session_state.water_alloc.logs:
+                # the first allocation after a reset makes it final
+                discard_snapshot(reset_snapshot, transcript=True)
+            elif st.button("↩️ Undo Reset", use_container_width=True):
+                try:
+                    water_alloc = load_snapshot(reset_snapshot)
+                    # the restored chat takes back the ledger's transcript id
+                    undo_id = water_alloc.messages.session_id
+                    st.session_state.water_alloc.messages.clear()
+                    water_alloc.messages.rename(st.session_state.ledger_id)
+                    try:
+                        if water_alloc.logs:
+                            save_snapshot(water_alloc, snapshot_name)
+                    except (OSError, ValueError):
+                        water_alloc.messages.rename(undo_id)
+                        raise
+                except (OSError, ValueError) as e:
+                    st.error(f"Undo failed: {e}")
+                else:
+                    discard_snapshot(reset_snapshot)
+                    start_session(water_alloc)
+                    st.rerun()
     
-    # Initialize components
-    analytics = Analytics(st.session_state.water_alloc)
-    dashboard = Dashboard(analytics, st.session_state.water_alloc)
-    simulator = ScenarioSimulator(st.session_state.water_alloc)
-    reports = ReportGenerator(st.session_state.water_alloc)
-    
-    # Create tabs
-    main_tab, dash_tab, sim_tab, report_tab, audit_tab = st.tabs([
-        "💬 Chat Assistant", "📊 Dashboard", "🎯 Simulation", 
-        "📋 Reports", "🔗 Audit Trail"
-    ])
+    # Only the selected view is imported and constructed on each rerun
+    views = VIEWS + ["🩺 Diagnostics"] if st.query_params.get("diagnostics") == "1" else VIEWS
+    view = st.radio("View", views, horizontal=True, label_visibility="collapsed", key="active_view")
+    water_alloc = st.session_state.water_alloc
     
-    with main_tab:
+    if view == CHAT_VIEW:
+        from chatbot import ChatBot
+        kb = st.session_state.get("knowledge_base")
         chatbot = ChatBot(
-            kb.kb_db,  # Use kb.kb_db directly
-            kb.user_db,
-            st.session_state.water_alloc,
+            kb_retriever,
+            kb.user_retriever() if kb else None,
+            water_alloc,
             st.session_state.drought_mode,
-            ollama_available  # Pass Ollama status
+            ollama_available,  # Pass Ollama status
+            embeddings=load_embeddings()
         )
         chatbot.render_chat()
     
-    with dash_tab:
+    elif view == "📊 Dashboard":
+        from analytics import Analytics
+        from visualizations import Dashboard
+        dashboard = Dashboard(Analytics(water_alloc), water_alloc)
         dashboard.render(st.session_state.drought_mode)
     
-    with sim_tab:
-        simulator.render()
+    elif view == "🎯 Simulation":
+        from simulation import ScenarioSimulator
+        ScenarioSimulator(water_alloc).render()
+    
+    elif view == "📋 Reports":
+        from reports import ReportGenerator
+        ReportGenerator(water_alloc).render()
     
-    with report_tab:
-        reports.render()
+    elif view == "🩺 Diagnostics":
+        from diagnostics import render_diagnostics
+        render_diagnostics()
     
-    with audit_tab:
+    else:
         st.subheader("🔗 Blockchain Audit Trail")
-        audit_data = st.session_state.water_alloc.audit.get_audit_report()
+        audit_data = water_alloc.audit.get_audit_report()
         if audit_data:
             import pandas as pd
             df = pd.DataFrame(audit_data)
@@ -148,7 +295,7 @@ def main():
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("Verify Blockchain", use_container_width=True):
-                    if st.session_state.water_alloc.audit.verify_chain():
+                    if water_alloc.audit.verify_chain():
                         st.success("✅ Blockchain verified - Chain is intact")
                     else:
                         st.error("❌ Blockchain corrupted!")
@@ -156,6 +303,11 @@ def main():
                 st.metric("Total Blocks", len(audit_data))
         else:
             st.info("No audit data available yet")
+    
+    # Periodic Prometheus/JSON dump of the stage latencies (no-op unless tracing)
+    tracer.maybe_export()
+    from snapshot import maybe_snapshot
+    maybe_snapshot(water_alloc, ledger_snapshot_names()[0])
 
 if __name__ == "__main__":
     try:
@@ -1,51 +1,172 @@
 import time
 import hashlib
 import json
+import struct
+import threading
+import weakref
 from collections import defaultdict
+from config import RESERVOIR_LEVELS
+from tracing import span
+
+# Block hash input: struct-packed index and timestamp, the previous block's
+# raw hash, then the canonical encoding of the payload
+BLOCK_HEADER = struct.Struct("<Qd")
+GENESIS_HASH = bytes(32)
+
+# Log entries are encoded as a fixed binary record (with the type of each
+# number, so 5 and 5.0 differ) followed by the UTF-8 strings and, for entries
+# that carry it, the reservoir level as one more typed number; any other
+# payload is encoded as sorted, compact JSON
+LOG_FIELDS = frozenset(("timestamp", "region", "sector", "allocated", "decision", "reason", "cycle", "requested"))
+LEVEL_LOG_FIELDS = LOG_FIELDS | {"level"}
+LOG_RECORD = struct.Struct("<cdqqc8sc8sIII")
+DOUBLE = struct.Struct("<d")
+_CANONICAL_JSON = json.JSONEncoder(sort_keys=True, separators=(",", ":"))
+
+
+def _number(value):
+    kind = type(value)
+    if kind is float:
+        return b"f", DOUBLE.pack(value)
+    if kind is int:
+        return b"i", value.to_bytes(8, "little", signed=True)
+    if value is None:
+        return b"n", bytes(8)
+    raise TypeError(f"unsupported number {value!r}")
+
+
+def _log_record(entry):
+    if type(entry["timestamp"]) is not float or type(entry["region"]) is not int or type(entry["cycle"]) is not int:
+        raise TypeError("not a log entry")
+    sector, decision, reason = entry["sector"].encode(), entry["decision"].encode(), entry["reason"].encode()
+    allocated_kind, allocated = _number(entry["allocated"])
+    requested_kind, requested = _number(entry["requested"])
+    record = LOG_RECORD.pack(
+        b"L", entry["timestamp"], entry["region"], entry["cycle"], allocated_kind, allocated,
+        requested_kind, requested, len(sector), len(decision), len(reason)
+    ) + sector + decision + reason
+    if "level" in entry:
+        level_kind, level = _number(entry["level"])
+        record += level_kind + level
+    return record
+
+
+def canonical_bytes(payload):
+    if type(payload) is dict and payload.keys() in (LOG_FIELDS, LEVEL_LOG_FIELDS):
+        try:
+            return _log_record(payload)
+        except (TypeError, AttributeError, OverflowError, struct.error):
+            pass
+    return b"J" + _CANONICAL_JSON.encode(payload).encode()
+
+
+class AuditBlock:
+    """One audit chain block. The payload is a reference to the logged entry
+    (not a copy) and both hashes are raw 32-byte SHA-256 digests."""
+    __slots__ = ("index", "timestamp", "payload", "previous_hash", "hash")
+
+    def __init__(self, index, timestamp, payload, previous_hash, hash=None):
+        self.index = index
+        self.timestamp = timestamp
+        self.payload = payload
+        self.previous_hash = previous_hash
+        self.hash = hash if hash is not None else self.compute_hash()
+
+    def compute_hash(self):
+        return hashlib.sha256(
+            BLOCK_HEADER.pack(self.index, self.timestamp) + self.previous_hash + canonical_bytes(self.payload)
+        ).digest()
+
 
 class AuditTrail:
     def __init__(self):
         self.chain = []
         
-    def add_block(self, data):
-        block = {
-            'index': len(self.chain),
-            'timestamp': time.time(),
-            'data': data,
-            'previous_hash': self.hash_block(self.chain[-1]) if self.chain else '0'
-        }
-        block['hash'] = self.hash_block(block)
+    def add_block(self, payload, timestamp=None):
+        # timestamp is only passed when replaying a journalled block
+        block = AuditBlock(
+            len(self.chain),
+            time.time() if timestamp is None else timestamp,
+            payload,
+            self.chain[-1].hash if self.chain else GENESIS_HASH
+        )
         self.chain.append(block)
         return block
     
     def hash_block(self, block):
-        block_string = f"{block['index']}{block['timestamp']}{block['data']}{block['previous_hash']}"
-        return hashlib.sha256(block_string.encode()).hexdigest()
+        return block.compute_hash()
     
-    def verify_chain(self):
-        for i in range(1, len(self.chain)):
-            if self.chain[i]['previous_hash'] != self.hash_block(self.chain[i-1]):
+    def verify_chain(self, start=0):
+        # start > 0 checks only the blocks from `start` onwards (each block's
+        # link to its predecessor included)
+        previous = self.chain[start - 1].hash if 0 < start <= len(self.chain) else GENESIS_HASH
+        for i in range(max(0, start), len(self.chain)):
+            block = self.chain[i]
+            if block.previous_hash != previous or block.compute_hash() != block.hash:
                 return False
+            previous = block.hash
         return True
     
     def get_audit_report(self):
         return [
             {
-                'index': b['index'],
-                'time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(b['timestamp'])),
-                'data': b['data'],
-                'hash': b['hash'][:8] + '...'
+                'index': b.index,
+                'time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(b.timestamp)),
+                'data': json.dumps(b.payload),
+                'hash': b.hash.hex()[:8] + '...'
             }
             for b in self.chain
         ]
 
+# Reservoir levels are process-wide (config.RESERVOIR_LEVELS), so a change made
+# through any ledger is published to every subscriber in the process
+_level_listeners = []
+_level_lock = threading.Lock()
+
+
+def subscribe_reservoir_levels(listener):
+    """Call the bound method listener(region, level) on every reservoir level
+    change. Only a weak reference is kept, so the owner can still be freed."""
+    with _level_lock:
+        _level_listeners.append(weakref.WeakMethod(listener))
+
+
+def publish_reservoir_level(region, level):
+    with _level_lock:
+        _level_listeners[:] = [ref for ref in _level_listeners if ref() is not None]
+        listeners = [ref() for ref in _level_listeners]
+    for listener in listeners:
+        if listener is None:
+            continue
+        try:
+            listener(region, level)
+        except Exception as e:
+            print(f"Reservoir level listener error: {e}")
+
+
 class WaterAllocation:
     def __init__(self):
         self.allocations = defaultdict(lambda: defaultdict(dict))
         self.logs = []
         self.audit = AuditTrail()
+        self.listeners = []
+        # held while a request is decided and while a snapshot is written
+        self.lock = threading.RLock()
+        
+    def subscribe(self, listener):
+        """Call listener(event, payload) on every "allocation" (payload: the log
+        entry) and "reservoir_level" (payload: {"region", "level"}) event."""
+        self.listeners.append(listener)
+        
+    def emit(self, event, payload):
+        for listener in self.listeners:
+            try:
+                listener(event, payload)
+            except Exception as e:
+                print(f"Listener error on {event}: {e}")
         
-    def add_allocation(self, region, cycle, sector, volume, decision, reason):
+    def add_allocation(self, region, cycle, sector, volume, decision, reason, requested=None, level=None):
+        # level: the region's reservoir level the decision was made under
         self.allocations[region][cycle][sector] = volume
         log_entry = {
             "timestamp": time.time(),
@@ -54,8 +175,24 @@ class WaterAllocation:
             "allocated": volume,
             "decision": decision,
             "reason": reason,
-            "cycle": cycle
+            "cycle": cycle,
+            "requested": requested
         }
+        if level is not None:
+            log_entry["level"] = level
         self.logs.append(log_entry)
-        self.audit.add_block(json.dumps(log_entry))
-        return log_entry
\ No newline at end of file
+        with span("audit.add_block"):
+            self.audit.add_block(log_entry)
+        self.emit("allocation", log_entry)
+        return log_entry
+    
+    def replay_allocation(self, log_entry, block_timestamp):
+        """Re-apply a journalled log entry so its audit block hashes exactly as before."""
+        self.allocations[log_entry["region"]][log_entry["cycle"]][log_entry["sector"]] = log_entry["allocated"]
+        self.logs.append(log_entry)
+        self.audit.add_block(log_entry, block_timestamp)
+    
+    def set_reservoir_level(self, region, level):
+        RESERVOIR_LEVELS[region] = level
+        self.emit("reservoir_level", {"region": region, "level": level})
+        publish_reservoir_level(region, level)
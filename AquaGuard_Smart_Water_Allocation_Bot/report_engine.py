@@ -0,0 +1,131 @@
+import time
+import threading
+from collections import defaultdict
+from config import RESERVOIR_LEVELS, RESERVOIR_SAFE_LEVEL, TOTAL_SUPPLIES
+
+
+class ReportEngine:
+    """Running report aggregates over WaterAllocation.logs.
+
+    The ledger is append-only, so its length is its version: refresh() folds
+    in only the entries added since the last report, the audit chain is only
+    verified from the last verified block onwards (verify_full() re-checks all
+    of it), and rendered reports are cached per ledger version."""
+
+    def __init__(self, water_alloc):
+        self.water_alloc = water_alloc
+        self.processed = 0
+        self.total_allocated = 0.0
+        self.approved = 0
+        self.by_sector = defaultdict(float)
+        self.by_region = defaultdict(float)
+        self.by_cycle = defaultdict(lambda: {"allocated": 0.0, "requests": 0, "approved": 0})
+        self.region_cycle_totals = defaultdict(float)
+        self.over_capacity = set()
+        self.low_level_allocations = 0
+        self.low_level_domestic = 0
+        self.verified_blocks = 0
+        self.chain_valid = True
+        self.verified_at = time.time()
+        self.fully_verified = None  # ledger version of the last full verification
+        self.artifacts = {}
+        # the engine is shared by every session showing the ledger
+        self.lock = threading.RLock()
+
+    @property
+    def version(self):
+        return len(self.water_alloc.logs)
+
+    def refresh(self):
+        with self.lock:
+            logs = self.water_alloc.logs
+            if self.processed == len(logs):
+                return self
+            for entry in logs[self.processed:]:
+                self._fold(entry)
+            self.processed = len(logs)
+            return self
+
+    def _fold(self, entry):
+        region, cycle, sector = entry["region"], entry["cycle"], entry["sector"]
+        allocated = entry["allocated"]
+        approved = entry["decision"] == "Approved"
+
+        self.total_allocated += allocated
+        self.approved += approved
+        self.by_sector[sector] += allocated
+        self.by_region[region] += allocated
+        period = self.by_cycle[cycle]
+        period["allocated"] += allocated
+        period["requests"] += 1
+        period["approved"] += approved
+
+        # the level the allocation was decided under; entries logged before
+        # levels were recorded fall back to the current one
+        level = entry.get("level", RESERVOIR_LEVELS.get(region, 100))
+        self.region_cycle_totals[(region, cycle)] += allocated
+        if self.region_cycle_totals[(region, cycle)] > TOTAL_SUPPLIES.get(region, 0) * level / 100:
+            self.over_capacity.add((region, cycle))
+        if level < RESERVOIR_SAFE_LEVEL:
+            self.low_level_allocations += 1
+            self.low_level_domestic += sector == "domestic"
+
+    def verify_chain(self):
+        """Verify the blocks appended since the last call; a broken chain stays broken."""
+        with self.lock:
+            audit = self.water_alloc.audit
+            if self.chain_valid and self.verified_blocks < len(audit.chain):
+                self.chain_valid = audit.verify_chain(start=self.verified_blocks)
+                self.verified_blocks = len(audit.chain)
+                self.verified_at = time.time()
+            return self.chain_valid
+
+    def verify_full(self, force=False):
+        """Verify every block, catching edits to blocks an earlier call already
+        checked. The result is reused until the ledger grows (or force=True)."""
+        with self.lock:
+            if force or self.fully_verified != self.version:
+                audit = self.water_alloc.audit
+                self.chain_valid = audit.verify_chain()
+                self.verified_blocks = len(audit.chain)
+                self.verified_at = time.time()
+                self.fully_verified = self.version
+            return self.chain_valid
+
+    def metrics(self):
+        with self.lock:
+            self.refresh()
+            requests = self.processed
+            pairs = len(self.region_cycle_totals)
+            return {
+                "total_allocated": self.total_allocated,
+                "total_requests": requests,
+                "avg_allocation": self.total_allocated / requests if requests else 0.0,
+                "approval_rate": self.approved / requests * 100 if requests else 0.0,
+                # share of allocations made under a below-safe reservoir that went to domestic use
+                "domestic_priority_adherence": (
+                    self.low_level_domestic / self.low_level_allocations * 100 if self.low_level_allocations else 100.0
+                ),
+                # share of region/cycle pairs whose total allocation stayed within usable supply
+                "reservoir_safety_compliance": (pairs - len(self.over_capacity)) / pairs * 100 if pairs else 100.0,
+                "low_level_allocations": self.low_level_allocations,
+                "over_capacity_periods": len(self.over_capacity),
+            }
+
+    def artifact(self, name, build, *key):
+        """Return the cached rendering of report `name` for the current ledger
+        version, building it (and dropping older versions) when needed."""
+        with self.lock:
+            self.refresh()
+            cache_key = (name, self.version) + key
+            if cache_key not in self.artifacts:
+                self.artifacts = {k: v for k, v in self.artifacts.items() if k[0] != name}
+                self.artifacts[cache_key] = build()
+            return self.artifacts[cache_key]
+
+
+def get_report_engine(water_alloc):
+    engine = getattr(water_alloc, "report_engine", None)
+    if engine is None:
+        engine = water_alloc.report_engine = ReportEngine(water_alloc)
+    return engine
@@ -0,0 +1,206 @@
+import re
+import math
+import heapq
+import hashlib
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from tracing import span, traced
+from config import HYBRID_ALPHA, HYBRID_FETCH_K, QUERY_VECTOR_CACHE_SIZE, SEARCH_WORKERS
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+# "Section 4.2", "clause 12(b)", "Art. 7" ... matched as (keyword, number) phrases,
+# and permit style identifiers such as "WP-2024-0113" or "LIC/12" (hyphen or slash
+# required, so acronyms like CO2 or PM2.5 stay ordinary words)
+CLAUSE_RE = re.compile(r"(?:\b(section|sec\.?|clause|article|art\.?|rule|regulation|schedule)|(§))\s*(\d+(?:\.\d+)*)", re.IGNORECASE)
+IDENTIFIER_RE = re.compile(r"\b[A-Z][A-Z0-9]*(?:[-/][A-Z0-9]+)*[-/][A-Z0-9]*\d[A-Z0-9]*\b")
+CLAUSE_KINDS = {"sec": "section", "sec.": "section", "§": "section", "art": "article", "art.": "article"}
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def chunk_id(doc):
+    """Stable id for a chunk, stored in its metadata the first time it is asked for."""
+    if "chunk_id" not in doc.metadata:
+        key = f"{doc.metadata.get('source', '')}|{doc.metadata.get('page', '')}|{doc.page_content}"
+        doc.metadata["chunk_id"] = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return doc.metadata["chunk_id"]
+
+
+def clause_refs(text):
+    """("section", "4.2") style keys for every clause reference in text."""
+    refs = []
+    for keyword, section_sign, number in CLAUSE_RE.findall(text):
+        keyword = (keyword or section_sign).lower()
+        refs.append((CLAUSE_KINDS.get(keyword, keyword), number))
+    return refs
+
+
+def exact_terms(question):
+    """Clause references (as ("clause", kind, number)) and identifiers (as
+    ("id", token)) in a question."""
+    terms = [("clause",) + ref for ref in clause_refs(question)]
+    terms += [("id", token) for identifier in IDENTIFIER_RE.findall(question) for token in tokenize(identifier)[:1]]
+    return terms
+
+
+class QueryVectorCache:
+    """LRU of recent question embeddings, keyed by model and question text."""
+
+    def __init__(self, max_entries=QUERY_VECTOR_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.vectors = OrderedDict()
+        self.lock = threading.Lock()
+
+    def embed(self, embeddings, question):
+        key = (getattr(embeddings, "model_name", type(embeddings).__name__), question.strip())
+        with self.lock:
+            vector = self.vectors.get(key)
+            if vector is not None:
+                self.vectors.move_to_end(key)
+                return vector
+        vector = embeddings.embed_query(question)
+        with self.lock:
+            self.vectors[key] = vector
+            while len(self.vectors) > self.max_entries:
+                self.vectors.popitem(last=False)
+        return vector
+
+
+_vector_cache = QueryVectorCache()
+_search_pool = None
+_pool_lock = threading.Lock()
+
+
+def embed_query(embeddings, question):
+    return _vector_cache.embed(embeddings, question)
+
+
+def get_search_pool():
+    """Process-wide thread pool used to search several stores at once."""
+    global _search_pool
+    with _pool_lock:
+        if _search_pool is None:
+            _search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="kb-search")
+        return _search_pool
+
+
+class BM25Index:
+    """Okapi BM25 over an in-memory inverted index (term -> {doc id: term frequency})."""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = []
+        self.doc_lengths = []
+        self.total_length = 0
+        self.postings = defaultdict(dict)
+        # phrase postings for clause references: (kind, number) -> doc ids
+        self.clauses = defaultdict(set)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add_documents(self, docs):
+        for doc in docs:
+            doc_id = len(self.docs)
+            tokens = tokenize(doc.page_content)
+            self.docs.append(doc)
+            self.doc_lengths.append(len(tokens))
+            self.total_length += len(tokens)
+            for term, tf in Counter(tokens).items():
+                self.postings[term][doc_id] = tf
+            for ref in clause_refs(doc.page_content):
+                self.clauses[ref].add(doc_id)
+
+    def scores(self, query, candidates=None):
+        if not self.docs:
+            return {}
+        n_docs = len(self.docs)
+        avg_length = self.total_length / n_docs or 1
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                if candidates is not None and doc_id not in candidates:
+                    continue
+                norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        return scores
+
+    def search(self, query, k=3):
+        top = heapq.nlargest(k, self.scores(query).items(), key=lambda item: item[1])
+        return [(self.docs[doc_id], score) for doc_id, score in top]
+
+    def lookup(self, term):
+        """Ids of documents containing an exact_terms() term."""
+        if term[0] == "clause":
+            return set(self.clauses.get(term[1:], ()))
+        return set(self.postings.get(term[1], ()))
+
+
+class HybridRetriever:
+    """Fuses BM25 and dense FAISS scores; clause numbers and identifiers are
+    answered straight from the inverted index without embedding the question."""
+
+    def __init__(self, dense, lexical, alpha=HYBRID_ALPHA):
+        self.dense = dense
+        self.lexical = lexical
+        self.alpha = alpha
+
+    def exact_search(self, question, k=3):
+        terms = exact_terms(question)
+        if not terms or not len(self.lexical):
+            return []
+        candidates = set()
+        for term in terms:
+            candidates |= self.lexical.lookup(term)
+        if not candidates:
+            return []
+        # candidates all contain the exact term; rank them by the rest of the question
+        scores = self.lexical.scores(question, candidates)
+        ranked = sorted(candidates, key=lambda doc_id: scores.get(doc_id, 0.0), reverse=True)
+        return [(self.lexical.docs[doc_id], 1.0) for doc_id in ranked[:k]]
+
+    def dense_search(self, question, k, query_vector=None):
+        if query_vector is None:
+            return self.dense.similarity_search_with_relevance_scores(question, k=k)
+        # same distance -> relevance mapping LangChain applies in similarity_search_with_relevance_scores
+        relevance = self.dense._select_relevance_score_fn()
+        hits = self.dense.similarity_search_with_score_by_vector(query_vector, k=k)
+        return [(doc, relevance(distance)) for doc, distance in hits]
+
+    @traced("kb.search")
+    def search(self, question, k=3, query_vector=None):
+        with span("kb.search.exact"):
+            exact = self.exact_search(question, k)
+        if exact:
+            return exact
+
+        fetch_k = k * HYBRID_FETCH_K
+        fused = {}
+        docs = {}
+
+        with span("kb.search.dense"):
+            dense = self.dense_search(question, fetch_k, query_vector)
+        for doc, score in dense:
+            cid = chunk_id(doc)
+            docs[cid] = doc
+            fused[cid] = self.alpha * score
+
+        with span("kb.search.lexical"):
+            lexical = self.lexical.search(question, k=fetch_k)
+        if lexical:
+            top = lexical[0][1] or 1.0
+            for doc, score in lexical:
+                cid = chunk_id(doc)
+                docs.setdefault(cid, doc)
+                fused[cid] = fused.get(cid, 0.0) + (1 - self.alpha) * score / top
+
+        ranked = heapq.nlargest(k, fused.items(), key=lambda item: item[1])
+        return [(docs[cid], score) for cid, score in ranked]
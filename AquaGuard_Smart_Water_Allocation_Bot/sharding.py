@@ -0,0 +1,254 @@
+import os
+import hashlib
+import weakref
+import threading
+import multiprocessing as mp
+from collections import defaultdict
+import config
+from allocations import AllocationProcessor
+from models import AuditTrail, GENESIS_HASH, WaterAllocation, subscribe_reservoir_levels
+from config import ALLOCATION_SHARDS
+
+
+def shard_statistics(water_alloc):
+    """Additive statistics of one shard, merged by ShardRouter.statistics()."""
+    stats = {
+        "total_allocated": 0.0,
+        "total_requests": 0,
+        "approved": 0,
+        "sector_breakdown": defaultdict(float),
+        "region_breakdown": defaultdict(float),
+    }
+    for log in water_alloc.logs:
+        stats["total_allocated"] += log["allocated"]
+        stats["total_requests"] += 1
+        stats["approved"] += log["decision"] == "Approved"
+        stats["sector_breakdown"][log["sector"]] += log["allocated"]
+        stats["region_breakdown"][log["region"]] += log["allocated"]
+    stats["sector_breakdown"] = dict(stats["sector_breakdown"])
+    stats["region_breakdown"] = dict(stats["region_breakdown"])
+    return stats
+
+
+def _process(processor, shard_id, request_text, drought_mode):
+    try:
+        return processor.process_request(request_text, drought_mode)
+    except Exception as e:
+        print(f"Allocation shard {shard_id} error: {e}")
+        return f"Allocation shard {shard_id} failed to process the request: {e}", "error"
+
+
+def _shard_worker(conn, shard_id):
+    """Owns the ledger slice and audit sub-chain of the regions routed to this shard.
+
+    A failing request is answered with an (error message, "error") result; any
+    other failing op sends the exception back for the router to raise."""
+    water_alloc = WaterAllocation()
+    processor = AllocationProcessor(water_alloc)
+    chain = water_alloc.audit.chain
+    while True:
+        try:
+            op, *args = conn.recv()
+        except EOFError:
+            break
+        try:
+            if op == "process":
+                conn.send(_process(processor, shard_id, *args))
+            elif op == "batch":
+                conn.send([_process(processor, shard_id, text, drought_mode) for text, drought_mode in args[0]])
+            elif op == "configure":
+                # spawned workers start from the module defaults; the dicts are
+                # shared by reference with allocations/models, so update in place
+                supplies, levels = args
+                config.TOTAL_SUPPLIES.update(supplies)
+                config.RESERVOIR_LEVELS.update(levels)
+                conn.send(None)
+            elif op == "reservoir_level":
+                water_alloc.set_reservoir_level(*args)
+                conn.send(None)
+            elif op == "stats":
+                conn.send(shard_statistics(water_alloc))
+            elif op == "head":
+                conn.send((len(chain), (chain[-1].hash if chain else GENESIS_HASH).hex()))
+            elif op == "verify":
+                conn.send(water_alloc.audit.verify_chain())
+            elif op == "logs":
+                conn.send(water_alloc.logs[args[0]:])
+            elif op == "stop":
+                conn.send(None)
+                break
+            else:
+                raise ValueError(f"Unknown shard op '{op}'")
+        except Exception as e:
+            print(f"Allocation shard {shard_id} error on {op}: {e}")
+            conn.send(e)
+
+
+def _shutdown(connections, processes, locks):
+    for conn, process, lock in zip(connections, processes, locks):
+        if process.is_alive():
+            try:
+                with lock:
+                    conn.send(("stop",))
+                    conn.recv()
+            except (EOFError, OSError):
+                pass
+            process.join(timeout=5)
+
+
+def _reply(reply):
+    if isinstance(reply, Exception):
+        raise reply
+    return reply
+
+
+class ShardRouter:
+    """Region-sharded allocation across worker processes.
+
+    Capacity checks only ever read one region's supply and allocations, so
+    regions are partitioned across shards (region % shards) and each worker
+    process runs its own WaterAllocation + AllocationProcessor. The router
+    dispatches requests by region; statistics are merged here and the heads
+    of the per-shard audit sub-chains are anchored into a global chain."""
+
+    def __init__(self, shards=None):
+        # None: ALLOCATION_SHARDS, or one shard per CPU when that is unset
+        if shards is None:
+            shards = ALLOCATION_SHARDS if ALLOCATION_SHARDS > 0 else os.cpu_count() or 1
+        if shards < 1:
+            raise ValueError("ShardRouter needs at least one shard")
+        context = mp.get_context("spawn")
+        self.parser = AllocationProcessor(None)
+        self.anchors = AuditTrail()
+        self.connections = []
+        self.processes = []
+        self.locks = []
+        for shard_id in range(shards):
+            parent, child = context.Pipe()
+            process = context.Process(target=_shard_worker, args=(child, shard_id), daemon=True,
+                                      name=f"allocation-shard-{shard_id}")
+            process.start()
+            self.connections.append(parent)
+            self.processes.append(process)
+            self.locks.append(threading.Lock())
+        # stops the workers on close(), when the router is freed, or at exit;
+        # holds the pipes and processes but not the router itself
+        self._finalizer = weakref.finalize(self, _shutdown, self.connections, self.processes, self.locks)
+        self._broadcast("configure", dict(config.TOTAL_SUPPLIES), dict(config.RESERVOIR_LEVELS))
+        subscribe_reservoir_levels(self.set_reservoir_level)
+
+    @property
+    def shards(self):
+        return len(self.connections)
+
+    def shard_for(self, region):
+        return region % self.shards
+
+    def _call(self, shard, *message):
+        with self.locks[shard]:
+            self.connections[shard].send(message)
+            return _reply(self.connections[shard].recv())
+
+    def _broadcast(self, *message):
+        # send to every shard first so they all work at the same time
+        for lock, conn in zip(self.locks, self.connections):
+            lock.acquire()
+            conn.send(message)
+        try:
+            replies = [conn.recv() for conn in self.connections]
+        finally:
+            for lock in self.locks:
+                lock.release()
+        return [_reply(reply) for reply in replies]
+
+    def process_request(self, request_text, drought_mode):
+        """Same contract as AllocationProcessor.process_request."""
+        region, *_, error = self.parser.parse_request(request_text)
+        if error:
+            return error, "error"
+        return self._call(self.shard_for(region), "process", request_text, drought_mode)
+
+    def set_reservoir_level(self, region, level):
+        config.RESERVOIR_LEVELS[region] = level
+        self._call(self.shard_for(region), "reservoir_level", region, level)
+
+    def process_batch(self, requests):
+        """Process (request_text, drought_mode) pairs with every shard working in
+        parallel. Results come back in input order; order within a region is kept.
+        The resulting shard heads are anchored into the global chain."""
+        results = [None] * len(requests)
+        per_shard = defaultdict(list)
+        for i, (text, drought_mode) in enumerate(requests):
+            region, *_, error = self.parser.parse_request(text)
+            if error:
+                results[i] = (error, "error")
+            else:
+                per_shard[self.shard_for(region)].append(i)
+
+        shards = sorted(per_shard)
+        for shard in shards:
+            self.locks[shard].acquire()
+        try:
+            for shard in shards:
+                self.connections[shard].send(("batch", [requests[i] for i in per_shard[shard]]))
+            replies = {shard: self.connections[shard].recv() for shard in shards}
+        finally:
+            for shard in shards:
+                self.locks[shard].release()
+        for shard in shards:
+            for i, result in zip(per_shard[shard], _reply(replies[shard])):
+                results[i] = result
+        self.anchor()
+        return results
+
+    def statistics(self):
+        """Same keys as Analytics.get_statistics, merged across shards."""
+        merged = {"total_allocated": 0.0, "total_requests": 0, "approved": 0,
+                  "sector_breakdown": defaultdict(float), "region_breakdown": defaultdict(float)}
+        for stats in self._broadcast("stats"):
+            for key in ("total_allocated", "total_requests", "approved"):
+                merged[key] += stats[key]
+            for key in ("sector_breakdown", "region_breakdown"):
+                for name, value in stats[key].items():
+                    merged[key][name] += value
+        if not merged["total_requests"]:
+            return {}
+        requests = merged.pop("total_requests")
+        approved = merged.pop("approved")
+        return {
+            "total_allocated": merged["total_allocated"],
+            "avg_allocation": merged["total_allocated"] / requests,
+            "total_requests": requests,
+            "approval_rate": approved / requests * 100,
+            "sector_breakdown": dict(merged["sector_breakdown"]),
+            "region_breakdown": dict(merged["region_breakdown"]),
+        }
+
+    def logs(self, shard, start=0):
+        return self._call(shard, "logs", start)
+
+    def verify(self):
+        return all(self._broadcast("verify"))
+
+    def audit_root(self):
+        """SHA-256 over every shard's (sub-chain length, head hash)."""
+        heads = self._broadcast("head")
+        payload = "|".join(f"{shard}:{length}:{head}" for shard, (length, head) in enumerate(heads))
+        return hashlib.sha256(payload.encode()).hexdigest(), heads
+
+    def anchor(self):
+        """Append the current global root (and the shard heads) to the anchor chain."""
+        root, heads = self.audit_root()
+        self.anchors.add_block({"root": root, "heads": heads})
+        return root
+
+    def close(self):
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
@@ -0,0 +1,607 @@
+import os
+import glob
+import json
+import mmap
+import time
+import uuid
+import struct
+import weakref
+import threading
+from collections import defaultdict
+from collections.abc import Sequence
+import numpy as np
+from config import SNAPSHOT_DIR, SNAPSHOT_INTERVAL, SNAPSHOT_NAME, SNAPSHOT_TTL
+from models import AuditBlock, GENESIS_HASH, WaterAllocation
+from transcript import ChatTranscript, remove_transcript
+
+# File layout: MAGIC, HEADER (n_logs, n_blocks, meta length), JSON meta, then
+# 8-byte aligned little-endian sections in _sections() order: one array per log
+# column, the block timestamps, the raw 32-byte block hashes and, per string
+# table, its end offsets and UTF-8 blob.
+MAGIC = b"AQGSNAP\x03"
+HEADER = struct.Struct("<8sQQQ")
+LOG_COLUMNS = (
+    ("timestamp", "<f8"),
+    ("region", "<i8"),
+    ("cycle", "<i8"),
+    ("allocated", "<f8"),
+    ("requested", "<f8"),
+    ("level", "<f8"),
+    ("sector", "<u4"),
+    ("decision", "<u4"),
+    ("reason", "<u4"),
+    ("flags", "u1"),
+)
+TABLES = ("sector", "decision", "reason")
+HASH_SIZE = 32
+
+# flags: which numbers were ints (json.dumps writes 5 and 5.0 differently), None,
+# and entries logged without a reservoir level
+ALLOCATED_INT = 1
+REQUESTED_INT = 2
+REQUESTED_NONE = 4
+LEVEL_INT = 8
+LEVEL_ABSENT = 16
+
+RESET_SNAPSHOT = "before_reset"
+
+
+def _sections(n_logs, n_blocks, tables):
+    for name, dtype in LOG_COLUMNS:
+        yield name, dtype, n_logs
+    yield "block_timestamp", "<f8", n_blocks
+    yield "hash", "u1", n_blocks * HASH_SIZE
+    for table in TABLES:
+        count, size = tables[table]
+        yield f"{table}_offsets", "<u8", count + 1
+        yield f"{table}_blob", "u1", size
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class StringTable:
+    """Strings stored as one UTF-8 blob plus end offsets, decoded on first use."""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+        self.decoded = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, code):
+        value = self.decoded.get(code)
+        if value is None:
+            start, end = int(self.offsets[code]), int(self.offsets[code + 1])
+            value = self.decoded[code] = self.blob[start:end].tobytes().decode("utf-8")
+        return value
+
+
+class _TableBuilder:
+    """Extends an existing table with new strings; existing codes stay valid."""
+
+    def __init__(self, base=None):
+        self.base = base
+        self.start = len(base) if base is not None else 0
+        self.codes = {}
+        self.strings = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = self.start + len(self.strings)
+            self.strings.append(value)
+        return code
+
+    def arrays(self):
+        encoded = [value.encode("utf-8") for value in self.strings]
+        offsets = self.base.offsets if self.base is not None else np.zeros(1, dtype="<u8")
+        blob = self.base.blob.tobytes() if self.base is not None else b""
+        lengths = np.fromiter(map(len, encoded), dtype="<u8", count=len(encoded))
+        offsets = np.concatenate([offsets, offsets[-1] + np.cumsum(lengths, dtype="<u8")]).astype("<u8")
+        return offsets, np.frombuffer(blob + b"".join(encoded), dtype="u1")
+
+
+class ColumnarLogs(Sequence):
+    """WaterAllocation.logs backed by snapshot columns.
+
+    Entries are materialized as dicts (same keys, order and number types as
+    add_allocation) when accessed; entries appended after the restore are
+    kept as plain dicts in `tail`."""
+
+    def __init__(self, columns, tables):
+        self.columns = columns
+        self.tables = tables
+        self.size = len(columns["timestamp"])
+        self.tail = []
+
+    def __len__(self):
+        return self.size + len(self.tail)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0:
+            raise IndexError("log index out of range")
+        if index >= self.size:
+            return self.tail[index - self.size]
+        return self._entry(index)
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self._entry(i)
+        yield from self.tail
+
+    def _entry(self, i):
+        c = self.columns
+        flags = int(c["flags"][i])
+        allocated = c["allocated"][i]
+        requested = c["requested"][i]
+        if flags & REQUESTED_NONE:
+            requested = None
+        else:
+            requested = int(requested) if flags & REQUESTED_INT else float(requested)
+        entry = {
+            "timestamp": float(c["timestamp"][i]),
+            "region": int(c["region"][i]),
+            "sector": self.tables["sector"][int(c["sector"][i])],
+            "allocated": int(allocated) if flags & ALLOCATED_INT else float(allocated),
+            "decision": self.tables["decision"][int(c["decision"][i])],
+            "reason": self.tables["reason"][int(c["reason"][i])],
+            "cycle": int(c["cycle"][i]),
+            "requested": requested,
+        }
+        if not flags & LEVEL_ABSENT:
+            level = c["level"][i]
+            entry["level"] = int(level) if flags & LEVEL_INT else float(level)
+        return entry
+
+    def append(self, entry):
+        self.tail.append(entry)
+
+
+class ColumnarChain(Sequence):
+    """AuditTrail.chain backed by the snapshot's block timestamps and raw
+    hashes. A block's payload is its log entry, so it is the matching
+    ColumnarLogs entry."""
+
+    def __init__(self, timestamps, hashes, logs):
+        self.timestamps = timestamps
+        self.hashes = hashes
+        self.logs = logs
+        self.size = len(timestamps)
+        self.tail = []
+
+    def __len__(self):
+        return self.size + len(self.tail)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0:
+            raise IndexError("block index out of range")
+        if index >= self.size:
+            return self.tail[index - self.size]
+        return self._block(index)
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self._block(i)
+        yield from self.tail
+
+    def _block(self, i):
+        return AuditBlock(
+            i,
+            float(self.timestamps[i]),
+            self.logs[i],
+            self.hashes[i - 1].tobytes() if i else GENESIS_HASH,
+            self.hashes[i].tobytes(),
+        )
+
+    def append(self, block):
+        self.tail.append(block)
+
+
+class LazyAllocations(defaultdict):
+    """WaterAllocation.allocations rebuilt from the snapshot columns one
+    region at a time, the first time that region is looked up."""
+
+    def __init__(self, logs):
+        super().__init__(lambda: defaultdict(dict))
+        self.logs = logs
+        self._pending = None
+
+    @property
+    def pending(self):
+        if self._pending is None:
+            self._pending = set(np.unique(self.logs.columns["region"]).tolist())
+        return self._pending
+
+    def __missing__(self, region):
+        cycles = defaultdict(dict)
+        if region in self.pending:
+            c, sectors = self.logs.columns, self.logs.tables["sector"]
+            for i in np.flatnonzero(c["region"] == region).tolist():
+                allocated = c["allocated"][i]
+                cycles[int(c["cycle"][i])][sectors[int(c["sector"][i])]] = (
+                    int(allocated) if c["flags"][i] & ALLOCATED_INT else float(allocated)
+                )
+            self.pending.discard(region)
+        self[region] = cycles
+        return cycles
+
+    def materialize(self):
+        for region in list(self.pending):
+            self[region]
+
+    def __contains__(self, region):
+        return region in self.pending or super().__contains__(region)
+
+    def __iter__(self):
+        self.materialize()
+        return super().__iter__()
+
+    def __len__(self):
+        self.materialize()
+        return super().__len__()
+
+    def keys(self):
+        self.materialize()
+        return super().keys()
+
+    def values(self):
+        self.materialize()
+        return super().values()
+
+    def items(self):
+        self.materialize()
+        return super().items()
+
+
+def _log_arrays(logs):
+    if isinstance(logs, ColumnarLogs):
+        base, entries = logs.columns, logs.tail
+        builders = {table: _TableBuilder(logs.tables[table]) for table in TABLES}
+    else:
+        base, entries = None, logs
+        builders = {table: _TableBuilder() for table in TABLES}
+
+    columns = {name: [] for name, _ in LOG_COLUMNS}
+    for entry in entries:
+        flags = 0
+        allocated, requested = entry["allocated"], entry["requested"]
+        if isinstance(allocated, int):
+            flags |= ALLOCATED_INT
+        if requested is None:
+            flags |= REQUESTED_NONE
+            requested = np.nan
+        elif isinstance(requested, int):
+            flags |= REQUESTED_INT
+        level = entry.get("level")
+        if level is None:
+            flags |= LEVEL_ABSENT
+            level = np.nan
+        elif isinstance(level, int):
+            flags |= LEVEL_INT
+        columns["timestamp"].append(entry["timestamp"])
+        columns["region"].append(entry["region"])
+        columns["cycle"].append(entry["cycle"])
+        columns["allocated"].append(allocated)
+        columns["requested"].append(requested)
+        columns["level"].append(level)
+        columns["flags"].append(flags)
+        for table in TABLES:
+            columns[table].append(builders[table].code(entry[table]))
+
+    arrays = {}
+    for name, dtype in LOG_COLUMNS:
+        array = np.array(columns[name], dtype=dtype)
+        arrays[name] = np.concatenate([base[name], array]) if base is not None else array
+    tables = {}
+    for table in TABLES:
+        offsets, blob = builders[table].arrays()
+        arrays[f"{table}_offsets"], arrays[f"{table}_blob"] = offsets, blob
+        tables[table] = (len(offsets) - 1, len(blob))
+    return arrays, tables
+
+
+def _chain_arrays(chain):
+    if isinstance(chain, ColumnarChain):
+        base_timestamps, base_hashes, blocks = chain.timestamps, chain.hashes.reshape(-1), chain.tail
+    else:
+        base_timestamps, base_hashes, blocks = np.empty(0, "<f8"), np.empty(0, "u1"), chain
+    timestamps = np.array([block.timestamp for block in blocks], dtype="<f8")
+    hashes = np.frombuffer(b"".join(block.hash for block in blocks), dtype="u1")
+    return {
+        "block_timestamp": np.concatenate([base_timestamps, timestamps]),
+        "hash": np.concatenate([base_hashes, hashes]),
+    }
+
+
+def _generations(name, directory):
+    paths = glob.glob(os.path.join(directory, f"{name}-*.snap"))
+    return sorted(paths, key=lambda path: int(path.rsplit("-", 1)[1][:-len(".snap")]))
+
+
+def snapshot_exists(name=SNAPSHOT_NAME, directory=SNAPSHOT_DIR):
+    return bool(_generations(name, directory))
+
+
+def journal_path(name=SNAPSHOT_NAME, directory=SNAPSHOT_DIR):
+    return os.path.join(directory, f"{name}.journal")
+
+
+def save_snapshot(water_alloc, name=SNAPSHOT_NAME, directory=SNAPSHOT_DIR):
+    """Write the ledger, audit chain and transcript id to a
+    new snapshot generation (temp file, fsync, rename), prune older
+    generations and start a new journal. Returns the snapshot path."""
+    # no allocation (and so no journal record) can land between the
+    # snapshot and the journal being truncated
+    with water_alloc.lock:
+        return _save_snapshot(water_alloc, name, directory)
+
+
+def _save_snapshot(water_alloc, name, directory):
+    logs, chain = water_alloc.logs, water_alloc.audit.chain
+    if len(logs) != len(chain):
+        raise ValueError(f"Ledger ({len(logs)} entries) and audit chain ({len(chain)} blocks) are out of step")
+
+    arrays, tables = _log_arrays(logs)
+    arrays.update(_chain_arrays(chain))
+    messages = getattr(water_alloc, "messages", None)
+    meta = json.dumps({
+        "created_at": time.time(),
+        "session_id": getattr(messages, "session_id", None),
+        "tables": tables,
+    }).encode("utf-8")
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}-{time.time_ns()}.snap")
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(logs), len(chain), len(meta)))
+        f.write(meta)
+        offset = HEADER.size + len(meta)
+        for section, dtype, count in _sections(len(logs), len(chain), tables):
+            f.write(b"\0" * (_align(offset) - offset))
+            data = np.ascontiguousarray(arrays[section], dtype=dtype).tobytes()
+            f.write(data)
+            offset = _align(offset) + len(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+    for old in _generations(name, directory)[:-1]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass  # still memory-mapped somewhere (Windows); pruned next time
+    journal = journal_path(name, directory)
+    if os.path.exists(journal):
+        open(journal, "w").close()
+    water_alloc.snapshot_info = (time.time(), len(logs))
+    return path
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, n_logs, n_blocks, meta_len = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not an AquaGuard snapshot")
+    meta = json.loads(buffer[HEADER.size:HEADER.size + meta_len])
+    arrays = {}
+    offset = HEADER.size + meta_len
+    for section, dtype, count in _sections(n_logs, n_blocks, meta["tables"]):
+        offset = _align(offset)
+        arrays[section] = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        offset += arrays[section].nbytes
+    return meta, arrays
+
+
+def replay_journal(water_alloc, path):
+    """Re-apply the events journalled after the snapshot was taken."""
+    if not os.path.exists(path):
+        return 0
+    replayed = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Journal {path}: stopping at a partially written record")
+                break
+            if record["event"] != "allocation":
+                continue  # reservoir levels are process-wide, never restored per ledger
+            if record["index"] < len(water_alloc.logs):
+                continue  # already in the snapshot
+            elif record["index"] > len(water_alloc.logs):
+                print(f"Journal {path}: entry {record['index']} does not follow entry {len(water_alloc.logs) - 1}")
+                break
+            else:
+                water_alloc.replay_allocation(record["entry"], record["block_timestamp"])
+                replayed += 1
+    return replayed
+
+
+def load_snapshot(name=SNAPSHOT_NAME, directory=SNAPSHOT_DIR, session_id=None):
+    """Restore the newest snapshot generation plus its journal tail, or None.
+
+    The columns are memory-mapped, so restore time does not grow with the
+    ledger; entries and blocks are materialized when they are read. The chat
+    transcript is the one the snapshot names, else `session_id`."""
+    generations = _generations(name, directory)
+    journal = journal_path(name, directory)
+    if not generations:
+        if not os.path.exists(journal):
+            return None
+        # journalled before the first snapshot was written
+        water_alloc = WaterAllocation()
+        water_alloc.messages = ChatTranscript(session_id or uuid.uuid4().hex)
+        replay_journal(water_alloc, journal)
+        return water_alloc
+    meta, arrays = _map(generations[-1])
+
+    tables = {table: StringTable(arrays[f"{table}_offsets"], arrays[f"{table}_blob"]) for table in TABLES}
+    logs = ColumnarLogs({name: arrays[name] for name, _ in LOG_COLUMNS}, tables)
+    water_alloc = WaterAllocation()
+    water_alloc.logs = logs
+    water_alloc.allocations = LazyAllocations(logs)
+    water_alloc.audit.chain = ColumnarChain(arrays["block_timestamp"], arrays["hash"].reshape(-1, HASH_SIZE), logs)
+    water_alloc.messages = ChatTranscript(meta["session_id"] or session_id or uuid.uuid4().hex)
+    water_alloc.snapshot_info = (meta["created_at"], len(logs))
+
+    replay_journal(water_alloc, journal)
+    return water_alloc
+
+
+def _read_meta(path):
+    with open(path, "rb") as f:
+        magic, _, _, meta_len = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an AquaGuard snapshot")
+        return json.loads(f.read(meta_len))
+
+
+def discard_snapshot(name, directory=SNAPSHOT_DIR, transcript=False):
+    """Delete every generation and the journal of snapshot `name`; with
+    transcript=True also the chat transcript the newest generation refers to."""
+    generations = _generations(name, directory)
+    if transcript and generations:
+        try:
+            session_id = _read_meta(generations[-1])["session_id"]
+        except (OSError, ValueError) as e:
+            print(f"Snapshot {name}: could not read the transcript id: {e}")
+        else:
+            if session_id:
+                remove_transcript(session_id)
+    for path in generations + [journal_path(name, directory)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def expire_snapshots(keep=(), max_age=SNAPSHOT_TTL, directory=SNAPSHOT_DIR):
+    """Delete the generations, journal and transcript of every snapshot name
+    not written to for max_age seconds, except the names in `keep`."""
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - max_age
+    newest = defaultdict(float)
+    for file_name in os.listdir(directory):
+        if file_name.endswith(".journal"):
+            name = file_name[:-len(".journal")]
+        elif file_name.endswith(".snap"):
+            name = file_name.rsplit("-", 1)[0]
+        else:
+            continue
+        try:
+            newest[name] = max(newest[name], os.path.getmtime(os.path.join(directory, file_name)))
+        except OSError:
+            pass
+    for name, mtime in newest.items():
+        if name not in keep and mtime < cutoff:
+            discard_snapshot(name, directory, transcript=True)
+
+
+class Journal:
+    """WaterAllocation listener appending every allocation since the last
+    snapshot to <name>.journal; records carry the audit block timestamp so
+    replay reproduces the block hashes. Reservoir levels are process-wide
+    state and are not journalled with a ledger."""
+
+    def __init__(self, water_alloc, path):
+        self.water_alloc = water_alloc
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, event, payload):
+        if event != "allocation":
+            return
+        record = {
+            "event": event,
+            "index": len(self.water_alloc.logs) - 1,
+            "entry": payload,
+            "block_timestamp": self.water_alloc.audit.chain[-1].timestamp,
+        }
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+def attach_journal(water_alloc, name=SNAPSHOT_NAME, directory=SNAPSHOT_DIR):
+    journal = getattr(water_alloc, "journal", None)
+    if journal is None:
+        os.makedirs(directory, exist_ok=True)
+        journal = water_alloc.journal = Journal(water_alloc, journal_path(name, directory))
+        water_alloc.subscribe(journal)
+    return journal
+
+
+def maybe_snapshot(water_alloc, name=SNAPSHOT_NAME, interval=SNAPSHOT_INTERVAL):
+    """Snapshot on a rerun once `interval` seconds have passed and the ledger changed."""
+    taken_at, version = getattr(water_alloc, "snapshot_info", (0.0, 0))
+    if len(water_alloc.logs) != version and time.time() - taken_at >= interval:
+        try:
+            save_snapshot(water_alloc, name)
+        except (OSError, ValueError) as e:
+            print(f"Snapshot failed: {e}")
+
+
+class LedgerRegistry:
+    """The ledgers open in this process, one WaterAllocation per ledger id.
+
+    Every session showing a ledger (a reload, a duplicated tab, a shared
+    link) works on the same object, so each ledger has a single writer for
+    its snapshot, journal and transcript. Sessions hold leases; a ledger is
+    dropped from memory once its last lease is released."""
+
+    def __init__(self, open_ledger):
+        self.open_ledger = open_ledger
+        self.ledgers = {}
+        self.leases = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def acquire(self, ledger_id):
+        with self._lock:
+            if ledger_id not in self.ledgers:
+                self.ledgers[ledger_id] = self.open_ledger(ledger_id)
+            self.leases[ledger_id] += 1
+        return LedgerLease(self, ledger_id)
+
+    def get(self, ledger_id):
+        with self._lock:
+            return self.ledgers[ledger_id]
+
+    def replace(self, ledger_id, water_alloc):
+        """Swap in a new ledger (reset / undo) for every session sharing the id."""
+        with self._lock:
+            self.ledgers[ledger_id] = water_alloc
+
+    def open_ids(self):
+        with self._lock:
+            return set(self.ledgers)
+
+    def release(self, ledger_id):
+        with self._lock:
+            self.leases[ledger_id] -= 1
+            if self.leases[ledger_id] <= 0:
+                del self.leases[ledger_id]
+                self.ledgers.pop(ledger_id, None)
+
+
+class LedgerLease:
+    def __init__(self, registry, ledger_id):
+        self.ledger_id = ledger_id
+        self._finalizer = weakref.finalize(self, registry.release, ledger_id)
+
+    def release(self):
+        self._finalizer()
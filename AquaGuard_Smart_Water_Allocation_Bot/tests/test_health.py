@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from health import BackendMonitor
+
+
+class StubOllama(ThreadingHTTPServer):
+    """Answers /api/tags with `tags_status`; /api/generate blocks until `release` is set."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.tags_status = 200
+        self.release = threading.Event()
+        self.generate_calls = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(self.server.tags_status)
+        self.end_headers()
+        self.wfile.write(json.dumps({"models": []}).encode())
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.generate_calls += 1
+        self.server.release.wait(10)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = StubOllama()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_available_and_warmed(stub):
+    stub.release.set()
+    monitor = BackendMonitor(host=stub.url, interval=0.05).start()
+    try:
+        assert monitor.wait_until_checked(5)
+        assert monitor.available
+        assert wait_for(lambda: monitor.warmed)
+        assert stub.generate_calls == 1
+    finally:
+        monitor.stop()
+
+
+def test_probing_continues_during_warmup(stub):
+    monitor = BackendMonitor(host=stub.url, interval=0.05).start()
+    try:
+        assert wait_for(lambda: stub.generate_calls == 1)
+        # warm-up is still blocked; the backend goes down and a request fails
+        stub.tags_status = 500
+        monitor.report_failure()
+        assert wait_for(lambda: monitor.failures > 0)
+        assert not monitor.available
+        stub.release.set()
+        time.sleep(0.1)
+        assert not monitor.warmed
+    finally:
+        monitor.stop()
+
+
+def test_backoff_when_backend_is_down():
+    monitor = BackendMonitor(host="http://127.0.0.1:9", interval=0.01, max_backoff=0.05, timeout=0.5).start()
+    try:
+        assert monitor.wait_until_checked(5)
+        assert wait_for(lambda: monitor.failures >= 3)
+        assert not monitor.available
+        assert not monitor.warmed
+        assert monitor.last_error
+    finally:
+        monitor.stop()
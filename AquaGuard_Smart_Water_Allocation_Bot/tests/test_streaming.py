@@ -0,0 +1,75 @@
+import types
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+from chatbot import ChatBot
+from llm import ResponseCache
+from models import WaterAllocation
+
+
+class FakeLLM:
+    """Yields a fixed answer token by token; optionally fails after `fail_after` tokens."""
+
+    def __init__(self, tokens, fail_after=None):
+        self.tokens = tokens
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def stream(self, prompt):
+        self.calls += 1
+        for i, token in enumerate(self.tokens):
+            if i == self.fail_after:
+                raise ConnectionError("backend went away")
+            yield token
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return "".join(self.tokens)
+
+
+def make_bot(llm):
+    bot = ChatBot(None, None, WaterAllocation(), False, ollama_available=True, llm=llm)
+    bot.cache = ResponseCache()
+    return bot
+
+
+def test_answer_streams_token_by_token_and_is_cached():
+    llm = FakeLLM(["Water ", "is ", "allocated ", "by ", "cycle."])
+    bot = make_bot(llm)
+
+    answer, source = bot.hybrid_query("How is water allocated?", stream=True)
+    assert source == "llm"
+    assert isinstance(answer, types.GeneratorType)
+    assert bot.cache.get("How is water allocated?", ()) is None  # nothing cached before the stream ends
+    assert list(answer) == llm.tokens
+
+    cached, source = bot.hybrid_query("how is water allocated", stream=True)
+    assert cached == "Water is allocated by cycle."
+    assert llm.calls == 1
+
+
+def test_failed_stream_is_not_cached(monkeypatch):
+    failures = []
+    monkeypatch.setattr("chatbot.get_monitor", lambda: types.SimpleNamespace(report_failure=lambda: failures.append(1)))
+    llm = FakeLLM(["partial ", "answer"], fail_after=1)
+    bot = make_bot(llm)
+
+    answer, _ = bot.hybrid_query("What is the drought threshold?", stream=True)
+    assert next(answer) == "partial "
+    with pytest.raises(ConnectionError):
+        next(answer)
+    assert failures == [1]
+    assert bot.cache.get("What is the drought threshold?", ()) is None
+
+
+def test_allocation_requests_are_never_streamed():
+    llm = FakeLLM(["unused"])
+    bot = make_bot(llm)
+    answer, status = bot.hybrid_query(
+        "Request: Region: 1, Population: 10, Sector: domestic, Volume: 100, Cycle: 1", stream=True
+    )
+    assert isinstance(answer, str)
+    assert status in ("approved", "reduced")
+    assert llm.calls == 0
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from collections import defaultdict, deque
+from functools import wraps
+from config import TRACE_ENABLED, TRACE_WINDOW, TRACE_EXPORT_DIR, TRACE_EXPORT_INTERVAL
+
+# Upper bounds (seconds) of the cumulative Prometheus histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Tracer:
+    """Per-stage latency recorder.
+
+    span(name) is a context manager; while tracing is disabled it returns a
+    shared no-op object, so instrumented code pays one attribute check.
+    Each stage keeps a rolling window of recent durations for percentiles
+    and cumulative bucket counts for the Prometheus export."""
+
+    def __init__(self, enabled=TRACE_ENABLED, window=TRACE_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.lock = threading.Lock()
+        self.last_export = time.time()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.samples = defaultdict(lambda: deque(maxlen=self.window))
+            self.buckets = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+            self.counts = defaultdict(int)
+            self.totals = defaultdict(float)
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else _NULL_SPAN
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.samples[name].append(seconds)
+            self.buckets[name][bisect_left(BUCKETS, seconds)] += 1
+            self.counts[name] += 1
+            self.totals[name] += seconds
+
+    def summary(self):
+        with self.lock:
+            snapshot = {name: sorted(samples) for name, samples in self.samples.items()}
+            counts, totals = dict(self.counts), dict(self.totals)
+        summary = {}
+        for name, samples in sorted(snapshot.items()):
+            if not samples:
+                continue
+            summary[name] = {
+                "count": counts[name],
+                "total_s": totals[name],
+                "p50_ms": _percentile(samples, 50) * 1000,
+                "p95_ms": _percentile(samples, 95) * 1000,
+                "p99_ms": _percentile(samples, 99) * 1000,
+                "max_ms": samples[-1] * 1000,
+            }
+        return summary
+
+    def to_prometheus(self):
+        with self.lock:
+            buckets = {name: list(counts) for name, counts in self.buckets.items()}
+            counts, totals = dict(self.counts), dict(self.totals)
+        lines = [
+            "# HELP aquaguard_stage_seconds Latency of instrumented AquaGuard stages.",
+            "# TYPE aquaguard_stage_seconds histogram",
+        ]
+        for name in sorted(buckets):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), buckets[name]):
+                cumulative += count
+                lines.append(f'aquaguard_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'aquaguard_stage_seconds_sum{{stage="{name}"}} {totals[name]}')
+            lines.append(f'aquaguard_stage_seconds_count{{stage="{name}"}} {counts[name]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory=TRACE_EXPORT_DIR):
+        """Write metrics.prom and metrics.json (atomically) and return their paths."""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for filename, content in (
+            ("metrics.prom", self.to_prometheus()),
+            ("metrics.json", json.dumps({"exported_at": time.time(), "stages": self.summary()}, indent=2)),
+        ):
+            path = os.path.join(directory, filename)
+            with open(path + ".tmp", "w") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+            paths.append(path)
+        self.last_export = time.time()
+        return paths
+
+    def maybe_export(self):
+        if self.enabled and time.time() - self.last_export >= TRACE_EXPORT_INTERVAL:
+            try:
+                self.export()
+            except OSError as e:
+                print(f"Metrics export failed: {e}")
+
+
+def _percentile(sorted_samples, pct):
+    index = min(len(sorted_samples) - 1, int(round(pct / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+tracer = Tracer()
+
+
+def span(name):
+    return tracer.span(name)
+
+
+def traced(name):
+    """Decorator form of span() for whole functions."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return fn(*args, **kwargs)
+            with _Span(tracer, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
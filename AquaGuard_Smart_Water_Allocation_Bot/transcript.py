@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from config import TRANSCRIPT_DIR, TRANSCRIPT_TTL, CHAT_WINDOW, CHAT_PAGE_SIZE
+
+
+def transcript_path(session_id, directory=TRANSCRIPT_DIR):
+    return os.path.join(directory, f"{session_id}.jsonl")
+
+
+def remove_transcript(session_id, directory=TRANSCRIPT_DIR):
+    try:
+        os.remove(transcript_path(session_id, directory))
+    except OSError:
+        pass
+
+
+def expire_transcripts(max_age=TRANSCRIPT_TTL, directory=TRANSCRIPT_DIR):
+    """Delete transcripts that have not been written to for max_age seconds."""
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if name.endswith(".jsonl") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class ChatTranscript:
+    """Chat history that keeps only the most recent messages in memory.
+
+    Every message is appended to a per-session JSON-lines file; messages
+    that fall out of the in-memory window are read back from it a page at a
+    time. Byte offsets of each line are kept so a page is one seek + read."""
+
+    def __init__(self, session_id, window=CHAT_WINDOW, directory=TRANSCRIPT_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.session_id = session_id
+        self.path = transcript_path(session_id, directory)
+        self.window = deque(maxlen=window)
+        self.offsets = []
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            self._reload()
+
+    def _reload(self):
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                self.offsets.append(offset)
+                offset += len(line)
+        for message in self.read(max(0, len(self.offsets) - self.window.maxlen), len(self.offsets)):
+            self.window.append(message)
+
+    def append(self, message):
+        line = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+        with self.lock:
+            with open(self.path, "ab") as f:
+                self.offsets.append(f.tell())
+                f.write(line)
+            self.window.append(message)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        return iter(list(self.window))
+
+    @property
+    def window_start(self):
+        """Index (in the full transcript) of the oldest message held in memory."""
+        return len(self.offsets) - len(self.window)
+
+    def read(self, start, stop):
+        """Messages [start, stop) of the full transcript, read from disk."""
+        start, stop = max(0, start), min(stop, len(self.offsets))
+        if start >= stop:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[start])
+            end = self.offsets[stop] if stop < len(self.offsets) else None
+            data = f.read() if end is None else f.read(end - self.offsets[start])
+        return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+    def earlier(self, pages, page_size=CHAT_PAGE_SIZE):
+        """The `pages` pages of messages immediately before the in-memory window."""
+        stop = self.window_start
+        return self.read(stop - pages * page_size, stop)
+
+    def rename(self, session_id):
+        """Move the transcript file to `session_id` (the undo point of a reset)."""
+        with self.lock:
+            path = transcript_path(session_id, os.path.dirname(self.path))
+            if os.path.exists(self.path):
+                os.replace(self.path, path)
+            self.session_id, self.path = session_id, path
+
+    def clear(self):
+        with self.lock:
+            self.window.clear()
+            self.offsets = []
+            if os.path.exists(self.path):
+                os.remove(self.path)
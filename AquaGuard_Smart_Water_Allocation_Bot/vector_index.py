@@ -0,0 +1,166 @@
+import time
+import argparse
+import json
+import numpy as np
+import faiss
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from config import (
+    FAISS_INDEX_TYPE, FAISS_NLIST, FAISS_NPROBE, FAISS_PQ_M,
+    FAISS_HNSW_M, FAISS_HNSW_EF_SEARCH, FAISS_TRAIN_SAMPLE
+)
+
+INDEX_TYPES = ["flat", "ivf_flat", "ivf_pq", "ivf_sq", "hnsw", "hnsw_sq", "sq"]
+
+# faiss wants roughly 39 training points per centroid: per IVF list, and per
+# each of the 256 centroids of an 8-bit PQ codebook (below that ivf_pq is Flat)
+MIN_POINTS_PER_CENTROID = 39
+MIN_PQ_TRAIN = MIN_POINTS_PER_CENTROID * 256
+
+
+def index_factory_string(index_type, dim, n_vectors):
+    """Translate an index type name into a faiss index_factory description."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}'. Must be one of {', '.join(INDEX_TYPES)}")
+
+    nlist = max(1, min(FAISS_NLIST, n_vectors // MIN_POINTS_PER_CENTROID))
+    pq_m = FAISS_PQ_M
+    while dim % pq_m:
+        pq_m -= 1
+
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivf_pq":
+        if n_vectors < MIN_PQ_TRAIN:
+            return "Flat"
+        return f"IVF{nlist},PQ{pq_m}x8"
+    if index_type == "ivf_sq":
+        return f"IVF{nlist},SQ8"
+    if index_type == "hnsw":
+        return f"HNSW{FAISS_HNSW_M}"
+    if index_type == "hnsw_sq":
+        return f"HNSW{FAISS_HNSW_M},SQ8"
+    if index_type == "sq":
+        return "SQ8"
+    return "Flat"
+
+
+def build_faiss_index(vectors, index_type=FAISS_INDEX_TYPE, add=True):
+    """Create (and train on a sample, when the index type needs it) a faiss index."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n_vectors, dim = vectors.shape
+    index = faiss.index_factory(dim, index_factory_string(index_type, dim, n_vectors))
+
+    if not index.is_trained:
+        sample = vectors
+        if n_vectors > FAISS_TRAIN_SAMPLE:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(n_vectors, FAISS_TRAIN_SAMPLE, replace=False)]
+        index.train(sample)
+
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", FAISS_NPROBE), ("efSearch", FAISS_HNSW_EF_SEARCH)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # parameter does not apply to this index type
+
+    if add:
+        index.add(vectors)
+    return index
+
+
+def build_vector_store(chunks, embeddings, index_type=FAISS_INDEX_TYPE):
+    """Build a LangChain FAISS store over chunks using the configured index type."""
+    if index_type == "flat":
+        return FAISS.from_documents(chunks, embeddings)
+
+    texts = [chunk.page_content for chunk in chunks]
+    metadatas = [chunk.metadata for chunk in chunks]
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype="float32")
+    index = build_faiss_index(vectors, index_type, add=False)
+
+    store = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={}
+    )
+    store.add_embeddings(list(zip(texts, vectors)), metadatas)
+    return store
+
+
+def index_memory_bytes(index):
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def synthetic_corpus(n_vectors, dim, n_clusters=200, seed=0):
+    """Clustered, L2-normalised vectors that resemble sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype("float32")
+    labels = rng.integers(0, n_clusters, size=n_vectors)
+    vectors = centers[labels] + 0.35 * rng.normal(size=(n_vectors, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def benchmark_index_types(n_vectors=100000, dim=384, n_queries=200, k=10, index_types=None, seed=0):
+    """Compare recall@k, query latency and memory of each index type against flat search."""
+    index_types = index_types or INDEX_TYPES
+    corpus = synthetic_corpus(n_vectors + n_queries, dim, seed=seed)
+    vectors, queries = corpus[:n_vectors], corpus[n_vectors:]
+
+    baseline = build_faiss_index(vectors, "flat")
+    _, truth = baseline.search(queries, k)
+
+    results = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_faiss_index(vectors, index_type)
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        hits = 0
+        for i in range(n_queries):
+            start = time.perf_counter()
+            _, found = index.search(queries[i:i + 1], k)
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(found[0]) & set(truth[i]))
+
+        latencies_ms = np.array(latencies) * 1000
+        results.append({
+            "index_type": index_type,
+            "factory": index_factory_string(index_type, dim, n_vectors),
+            "recall_at_k": hits / (n_queries * k),
+            "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+            "latency_p95_ms": float(np.percentile(latencies_ms, 95)),
+            "memory_mb": index_memory_bytes(index) / 1e6,
+            "build_seconds": build_seconds
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index types against exact flat search")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES)
+    parser.add_argument("--json", help="Write results to this file as JSON")
+    args = parser.parse_args()
+
+    results = benchmark_index_types(args.vectors, args.dim, args.queries, args.k, args.types)
+
+    print(f"{'index':<10}{'factory':<20}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p95 ms':>10}{'memory MB':>12}{'build s':>10}")
+    for r in results:
+        print(f"{r['index_type']:<10}{r['factory']:<20}{r['recall_at_k']:>10.3f}{r['latency_p50_ms']:>10.3f}"
+              f"{r['latency_p95_ms']:>10.3f}{r['memory_mb']:>12.1f}{r['build_seconds']:>10.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,50 @@ import streamlit as st
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
+import numpy as np
+from config import MAX_LINE_POINTS, REGIONS_PER_PAGE
+from tracing import traced
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling; returns the indices of
+    the points to keep (always including the first and last)."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # average of the next bucket (the last point for the final bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        ax, ay = x[selected], y[selected]
+        area = np.abs((ax - avg_x) * (y[start:end] - ay) - (ax - x[start:end]) * (avg_y - ay))
+        selected = start + int(np.argmax(area))
+        keep[i + 1] = selected
+    return keep
 
 class Dashboard:
     def __init__(self, analytics, water_alloc):
         self.analytics = analytics
         self.water_alloc = water_alloc
         
+    def cached(self, name, build):
+        """Figures and aggregates are rebuilt only when the ledger has grown."""
+        version = len(self.water_alloc.logs)
+        cache = getattr(self.water_alloc, "figure_cache", None)
+        if cache is None or cache["version"] != version:
+            cache = self.water_alloc.figure_cache = {"version": version}
+        if name not in cache:
+            cache[name] = build()
+        return cache[name]
+        
+    @traced("dashboard.render")
     def render(self, drought_mode):
         df = self.analytics.get_dataframe()
         
@@ -30,7 +68,7 @@ class Dashboard:
             st.info("No data available yet")
             return
             
-        stats = self.analytics.get_statistics()
+        stats = self.cached("statistics", self.analytics.get_statistics)
         
         col1, col2, col3, col4 = st.columns(4)
         with col1:
@@ -45,20 +83,20 @@ class Dashboard:
         
         col_left, col_right = st.columns(2)
         with col_left:
-            fig = px.pie(
+            fig = self.cached("sector_pie", lambda: px.pie(
                 values=list(stats['sector_breakdown'].values()),
                 names=list(stats['sector_breakdown'].keys()),
                 title="Allocation by Sector"
-            )
+            ))
             st.plotly_chart(fig, use_container_width=True)
         
         with col_right:
-            fig = px.bar(
+            fig = self.cached("region_bar", lambda: px.bar(
                 x=list(stats['region_breakdown'].keys()),
                 y=list(stats['region_breakdown'].values()),
                 title="Allocation by Region",
                 labels={'x': 'Region', 'y': 'Liters'}
-            )
+            ))
             st.plotly_chart(fig, use_container_width=True)
     
     def render_trends(self, df):
@@ -66,24 +104,31 @@ class Dashboard:
             st.info("No trend data available")
             return
             
-        df['time_str'] = pd.to_datetime(df['timestamp'], unit='s')
-        time_df = df.groupby('time_str')['allocated'].sum().reset_index()
-        
-        fig = px.line(
-            time_df, 
-            x='time_str', 
-            y='allocated',
-            title="Allocation Trends Over Time",
-            labels={'allocated': 'Liters', 'time_str': 'Time'}
-        )
+        fig = self.cached("trend_line", lambda: self.build_trend_figure(df))
         st.plotly_chart(fig, use_container_width=True)
         
-        forecasts = self.analytics.forecast_demand()
+        forecasts = self.cached("forecast", self.analytics.forecast_demand)
         if forecasts:
             st.subheader("📈 Demand Forecast")
             for region, forecast in forecasts.items():
                 st.metric(f"Region {region} Forecast", f"{forecast:,.0f} L")
     
+    def build_trend_figure(self, df):
+        series = df.groupby('timestamp')['allocated'].sum()
+        # Long histories are downsampled and drawn with a WebGL trace
+        keep = lttb(series.index.values, series.values, MAX_LINE_POINTS)
+        fig = go.Figure(go.Scattergl(
+            x=pd.to_datetime(series.index.values[keep], unit='s'),
+            y=series.values[keep],
+            mode='lines'
+        ))
+        fig.update_layout(
+            title="Allocation Trends Over Time",
+            xaxis_title="Time",
+            yaxis_title="Liters"
+        )
+        return fig
+    
     def render_regions(self, df):
         if df.empty:
             st.info("No region data available")
@@ -91,28 +136,40 @@ class Dashboard:
             
         from config import RESERVOIR_LEVELS
         
-        for region in df['region'].unique():
+        # One groupby for every region instead of two per region
+        region_stats = self.cached("region_stats", lambda: df.groupby('region')['allocated'].agg(['sum', 'count', 'mean']))
+        sector_totals = self.cached("region_sector_totals", lambda: df.groupby(['region', 'sector'])['allocated'].sum())
+        
+        regions = list(region_stats.index)
+        pages = max(1, -(-len(regions) // REGIONS_PER_PAGE))
+        page = st.number_input(f"Region page (of {pages})", min_value=1, max_value=pages, value=1) if pages > 1 else 1
+        
+        for region in regions[(page - 1) * REGIONS_PER_PAGE:page * REGIONS_PER_PAGE]:
             with st.expander(f"Region {region} Details"):
-                region_data = df[df['region'] == region]
+                row = region_stats.loc[region]
                 level = RESERVOIR_LEVELS.get(region, 100)
                 
                 col1, col2 = st.columns(2)
                 with col1:
                     st.metric("Reservoir Level", f"{level}%")
-                    st.metric("Total Used", f"{region_data['allocated'].sum():,.0f} L")
+                    st.metric("Total Used", f"{row['sum']:,.0f} L")
                 with col2:
-                    st.metric("Requests", len(region_data))
-                    st.metric("Avg Allocation", f"{region_data['allocated'].mean():,.0f} L")
+                    st.metric("Requests", int(row['count']))
+                    st.metric("Avg Allocation", f"{row['mean']:,.0f} L")
                 
-                fig = px.pie(
-                    values=region_data.groupby('sector')['allocated'].sum().values,
-                    names=region_data.groupby('sector')['allocated'].sum().index,
-                    title=f"Region {region} Sector Distribution"
-                )
-                st.plotly_chart(fig, use_container_width=True)
+                # Streamlit runs expander bodies even when collapsed, so the
+                # chart is only built once asked for
+                if st.toggle("Show sector distribution", key=f"region_chart_{region}"):
+                    region_sectors = sector_totals.loc[region]
+                    fig = self.cached(f"region_pie_{region}", lambda: px.pie(
+                        values=region_sectors.values,
+                        names=region_sectors.index,
+                        title=f"Region {region} Sector Distribution"
+                    ))
+                    st.plotly_chart(fig, use_container_width=True)
     
     def render_anomalies(self):
-        anomalies = self.analytics.detect_anomalies()
+        anomalies = self.cached("anomalies", self.analytics.detect_anomalies)
         if anomalies.empty:
             st.success("✅ No anomalies detected")
         else: